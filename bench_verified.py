@@ -0,0 +1,469 @@
+# 디스코드에 연결하지 않고 인증/세팅 흐름에 부하를 주는 벤치마크
+#
+# 사용법: python bench_verified.py --verifications 2000 --guilds 50 --output bench_results.json
+#
+# Interaction, Guild, Member, Role, TextChannel을 흉내 낸 가짜 객체와
+# 지연시간/429를 흉내 내는 REST 계층으로 verified.py의 실제 코드를 실행합니다.
+# 결과는 JSON으로 저장되므로 버전 간에 비교할 수 있습니다.
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import discord
+
+import verified
+
+
+class FakeHttpResponse:
+
+    def __init__(self, status: int, reason: str, headers: dict):
+        self.status = status
+        self.reason = reason
+        self.headers = headers
+
+
+class SimulatedRest:
+
+    # 모든 가짜 REST 호출이 지나가는 곳: 지연시간과 429를 주입함
+    # surfaced 경로의 429는 예외로 올려보내고(봇 코드가 직접 처리),
+    # 나머지는 discord.py처럼 Retry-After만큼 기다렸다가 다시 시도함
+    surfaced = {"add_roles"}
+
+    def __init__(self, latency: float, jitter: float, rate_limit_chance: float, retry_after: float):
+        self.latency = latency
+        self.jitter = jitter
+        self.rate_limit_chance = rate_limit_chance
+        self.retry_after = retry_after
+        self.calls = {}
+        self.rate_limited = {}
+
+    async def call(self, route: str):
+        while True:
+            self.calls[route] = self.calls.get(route, 0) + 1
+            await asyncio.sleep(max(0.0, random.gauss(self.latency, self.jitter)))
+
+            if not self.rate_limit_chance or random.random() >= self.rate_limit_chance:
+                return
+
+            self.rate_limited[route] = self.rate_limited.get(route, 0) + 1
+            if route not in self.surfaced:
+                await asyncio.sleep(self.retry_after)
+                continue
+
+            response = FakeHttpResponse(
+                429,
+                "Too Many Requests",
+                {"Retry-After": str(self.retry_after), "X-RateLimit-Reset-After": str(self.retry_after)}
+            )
+            raise discord.HTTPException(response, {"message": "You are being rate limited.", "code": 0})
+
+
+class FakeRole:
+
+    def __init__(self, role_id: int, name: str):
+        self.id = role_id
+        self.name = name
+        self.mention = f"<@&{role_id}>"
+        self.managed = False
+
+    def is_default(self):
+        return False
+
+    def is_assignable(self):
+        return True
+
+
+class FakeTextChannel:
+
+    def __init__(self, channel_id: int, rest: SimulatedRest):
+        self.id = channel_id
+        self.mention = f"<#{channel_id}>"
+        self.rest = rest
+        self.embeds_sent = 0
+
+    async def send(self, content=None, *, embed=None, embeds=None, view=None):
+        await self.rest.call("send_message")
+        self.embeds_sent += len(embeds) if embeds else 1
+
+
+class FakeBotMember:
+
+    def __init__(self):
+        self.guild_permissions = discord.Permissions(manage_roles=True)
+
+
+class FakeGuild:
+
+    def __init__(self, guild_id: int, role: FakeRole, log_channel: FakeTextChannel):
+        self.id = guild_id
+        self.shard_id = 0
+        self.roles = [role]
+        self._roles = {role.id: role}
+        self._channels = {log_channel.id: log_channel}
+        self.owner = None
+        # 봇 자신: 역할 관리 권한이 있고 인증 역할보다 위에 있음
+        self.me = FakeBotMember()
+
+    def get_role(self, role_id: int):
+        return self._roles.get(role_id)
+
+    def get_channel(self, channel_id: int):
+        return self._channels.get(channel_id)
+
+
+class FakeMember:
+
+    def __init__(self, member_id: int, guild: FakeGuild, rest: SimulatedRest):
+        self.id = member_id
+        self.guild = guild
+        self.mention = f"<@{member_id}>"
+        self.rest = rest
+        self.role_ids = set()
+
+    def __str__(self):
+        return f"user{self.id}"
+
+    def get_role(self, role_id: int):
+        return self.guild.get_role(role_id) if role_id in self.role_ids else None
+
+    async def add_roles(self, *roles):
+        await self.rest.call("add_roles")
+        self.role_ids.update(role.id for role in roles)
+
+
+class FakeResponse:
+
+    def __init__(self, interaction):
+        self.interaction = interaction
+        self._done = False
+
+    def is_done(self):
+        return self._done
+
+    async def _respond(self, route: str):
+        if self._done:
+            raise RuntimeError("이미 응답한 상호작용입니다")
+        self._done = True
+        await self.interaction.rest.call(route)
+        self.interaction.mark_first_response()
+
+    async def send_message(self, content=None, *, embed=None, view=None, ephemeral=False):
+        await self._respond("interaction_response")
+        self.interaction.messages.append(content)
+
+    async def defer(self, *, ephemeral=False, thinking=False):
+        await self._respond("interaction_response")
+
+    async def send_modal(self, modal):
+        await self._respond("interaction_response")
+        self.interaction.modal = modal
+
+    async def edit_message(self, *, embed=None, view=None):
+        await self._respond("interaction_response")
+
+
+class FakeFollowup:
+
+    def __init__(self, interaction):
+        self.interaction = interaction
+
+    async def send(self, content=None, *, ephemeral=False):
+        await self.interaction.rest.call("followup")
+        self.interaction.messages.append(content)
+
+
+class FakeInteraction:
+
+    def __init__(self, guild: FakeGuild, user: FakeMember, rest: SimulatedRest):
+        self.guild = guild
+        self.guild_id = guild.id
+        self.user = user
+        self.rest = rest
+        self.extras = {}
+        self.messages = []
+        self.modal = None
+        self.created_at = discord.utils.utcnow()
+        self.started_at = time.perf_counter()
+        self.first_response_at = None
+        self.response = FakeResponse(self)
+        self.followup = FakeFollowup(self)
+
+    def mark_first_response(self):
+        if self.first_response_at is None:
+            self.first_response_at = time.perf_counter()
+
+
+class LoopLagMonitor:
+
+    # 일정 간격으로 깨어나서 예정보다 얼마나 늦게 깨어났는지 기록
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.samples = []
+        self._task = None
+
+    async def _run(self):
+        while True:
+            started = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            self.samples.append(max(0.0, time.perf_counter() - started - self.interval))
+
+    def start(self):
+        self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self):
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+
+
+def percentiles(values: list):
+    if not values:
+        return {"count": 0}
+    ordered = sorted(values)
+
+    def pick(fraction: float):
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] * 1000
+
+    return {
+        "count": len(ordered),
+        "mean_ms": sum(ordered) / len(ordered) * 1000,
+        "p50_ms": pick(0.50),
+        "p90_ms": pick(0.90),
+        "p99_ms": pick(0.99),
+        "max_ms": ordered[-1] * 1000
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True,
+            text=True,
+            check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def build_guilds(count: int, rest: SimulatedRest):
+    guilds = []
+    for index in range(count):
+        guild_id = 100000 + index
+        role = FakeRole(200000 + index, "인증됨")
+        channel = FakeTextChannel(300000 + index, rest)
+        guild = FakeGuild(guild_id, role, channel)
+        verified.update_server_config(
+            guild_id,
+            setup_complete=True,
+            verified_role_id=role.id,
+            log_channel_id=channel.id
+        )
+        guilds.append(guild)
+    return guilds
+
+
+async def run_verifications(args, guilds: list, rest: SimulatedRest):
+    total_latencies = []
+    first_response_latencies = []
+    outcomes = {}
+
+    async def click(guild: FakeGuild, member: FakeMember, delay: float):
+        await asyncio.sleep(delay)
+        interaction = FakeInteraction(guild, member, rest)
+        await verified.VerifyButton(guild.id).callback(interaction)
+        finished = time.perf_counter()
+
+        total_latencies.append(finished - interaction.started_at)
+        if interaction.first_response_at is not None:
+            first_response_latencies.append(interaction.first_response_at - interaction.started_at)
+        outcome = (interaction.messages[-1] or "")[:1] if interaction.messages else "?"
+        outcomes[outcome] = outcomes.get(outcome, 0) + 1
+
+    clicks = []
+    for index in range(args.verifications):
+        guild = guilds[index % len(guilds)]
+        member = FakeMember(1000000 + index, guild, rest)
+        delay = random.uniform(0, args.spread)
+        clicks.append(click(guild, member, delay))
+        # 일부 사용자는 버튼을 연타함
+        if random.random() < args.duplicate_rate:
+            clicks.append(click(guild, member, delay + random.uniform(0, 0.2)))
+
+    started = time.perf_counter()
+    await asyncio.gather(*clicks)
+    elapsed = time.perf_counter() - started
+
+    return {
+        "clicks": len(clicks),
+        "elapsed_s": elapsed,
+        "throughput_per_s": len(clicks) / elapsed if elapsed else None,
+        "total_latency": percentiles(total_latencies),
+        "first_response_latency": percentiles(first_response_latencies),
+        "within_3s_window": sum(1 for value in first_response_latencies if value < 3.0),
+        "outcomes": outcomes
+    }
+
+
+async def run_setup_flows(args, guilds: list, rest: SimulatedRest):
+    latencies = []
+
+    async def submit(guild: FakeGuild, index: int):
+        member = FakeMember(5000000 + index, guild, rest)
+        interaction = FakeInteraction(guild, member, rest)
+
+        if index % 2:
+            modal = verified.EmbedSettingModal(guild.id)
+            modal.embed_title._value = f"인증 시스템 {index}"
+            modal.embed_description._value = "버튼을 눌러 인증하세요"
+            modal.embed_color._value = f"{random.randint(0, 0xFFFFFF):06X}"
+        else:
+            modal = verified.ButtonSettingModal(guild.id)
+            modal.button_label._value = f"인증하기 {index}"
+            modal.button_emoji._value = "🔐"
+
+        started = time.perf_counter()
+        await modal.on_submit(interaction)
+        latencies.append(time.perf_counter() - started)
+        modal.stop()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(submit(guilds[index % len(guilds)], index) for index in range(args.setup_ops)))
+    elapsed = time.perf_counter() - started
+
+    return {
+        "operations": args.setup_ops,
+        "elapsed_s": elapsed,
+        "latency": percentiles(latencies)
+    }
+
+
+async def run(args):
+    rest = SimulatedRest(args.latency, args.jitter, args.rate_limit_chance, args.retry_after)
+
+    verified.role_grant_scheduler = verified.RoleGrantScheduler(
+        args.grant_workers,
+        args.grant_rate,
+        args.grant_window,
+        verified.ROLE_GRANT_MAX_RETRIES
+    )
+    verified.load_configs()
+    guilds = build_guilds(args.guilds, rest)
+    await verified.flush_configs()
+
+    save_before = dict(verified.save_stats)
+    monitor = LoopLagMonitor(0.01)
+    monitor.start()
+
+    verification_results = await run_verifications(args, guilds, rest)
+    setup_results = await run_setup_flows(args, guilds, rest)
+
+    await verified.verification_log_writer.flush_all()
+    await verified.verification_audit.flush(save_counters=True)
+    await verified.flush_configs()
+    await monitor.stop()
+
+    config_file = verified.SQLITE_FILE if verified.STORAGE_BACKEND == "sqlite" else verified.CONFIG_FILE
+
+    return {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "discord_py": discord.__version__,
+        "parameters": vars(args),
+        "verification": verification_results,
+        "setup": setup_results,
+        "responses": dict(verified.response_path_stats),
+        "collapsed_clicks": verified.inflight_stats["collapsed"],
+        "admission": {
+            "admitted": verified.admission.admitted,
+            "rejected": dict(verified.admission.rejected)
+        },
+        "rest": {
+            "calls": rest.calls,
+            "rate_limited": rest.rate_limited,
+            "scheduler_rate_limited": verified.role_grant_scheduler.rate_limited
+        },
+        "audit_events": verified.verification_audit.recorded,
+        "log_writer": {
+            "messages": verified.verification_log_writer.sent_messages,
+            "embeds": verified.verification_log_writer.sent_embeds
+        },
+        "event_loop_lag": percentiles(monitor.samples),
+        "config_writes": {
+            "flushes": verified.save_stats["flush_count"] - save_before["flush_count"],
+            "bytes_written": verified.save_stats["bytes_written"] - save_before["bytes_written"],
+            "flush_ms_total": verified.save_stats["total_flush_ms"] - save_before["total_flush_ms"],
+            "file_size": os.path.getsize(config_file) if os.path.exists(config_file) else 0
+        }
+    }
+
+
+def parse_args(argv: list):
+    parser = argparse.ArgumentParser(description="verified.py 오프라인 부하 테스트")
+    parser.add_argument("--verifications", type=int, default=2000, help="인증 버튼 클릭 수")
+    parser.add_argument("--guilds", type=int, default=50, help="서버 수")
+    parser.add_argument("--spread", type=float, default=1.0, help="클릭이 퍼지는 시간(초)")
+    parser.add_argument("--duplicate-rate", type=float, default=0.1, help="버튼을 연타하는 사용자 비율")
+    parser.add_argument("--setup-ops", type=int, default=200, help="세팅 모달 제출 수")
+    parser.add_argument("--latency", type=float, default=0.08, help="REST 평균 지연시간(초)")
+    parser.add_argument("--jitter", type=float, default=0.02, help="REST 지연시간 표준편차(초)")
+    parser.add_argument("--rate-limit-chance", type=float, default=0.01, help="REST 호출이 429를 받을 확률")
+    parser.add_argument("--retry-after", type=float, default=0.5, help="429 응답의 Retry-After(초)")
+    parser.add_argument("--grant-workers", type=int, default=verified.ROLE_GRANT_WORKERS)
+    parser.add_argument("--grant-rate", type=int, default=verified.ROLE_GRANT_RATE)
+    parser.add_argument("--grant-window", type=float, default=verified.ROLE_GRANT_WINDOW)
+    parser.add_argument("--storage", choices=("json", "sqlite"), default=verified.STORAGE_BACKEND)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", default="bench_results.json", help="결과 JSON 파일 경로")
+    return parser.parse_args(argv)
+
+
+def main(argv: list = None):
+    args = parse_args(sys.argv[1:] if argv is None else argv)
+    random.seed(args.seed)
+    output = os.path.abspath(args.output)
+
+    # 실제 설정 파일을 건드리지 않도록 임시 폴더에서 실행
+    with tempfile.TemporaryDirectory() as workdir:
+        verified.CONFIG_FILE = os.path.join(workdir, "server_configs.json")
+        verified.SQLITE_FILE = os.path.join(workdir, "server_configs.db")
+        verified.STORAGE_BACKEND = args.storage
+        verified.verification_audit = verified.VerificationAuditStore(
+            os.path.join(workdir, "verification_audit"),
+            verified.AUDIT_ROTATE_BYTES,
+            verified.AUDIT_FLUSH_INTERVAL,
+            verified.AUDIT_COUNTER_SAVE_INTERVAL
+        )
+        verified.verification_audit.load()
+        try:
+            results = asyncio.run(run(args))
+        finally:
+            verified.close_config_backend()
+
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+
+    verification = results["verification"]
+    print(f'클릭 {verification["clicks"]}회, {verification["elapsed_s"]:.1f}초, 처리량 {verification["throughput_per_s"]:.1f}/s')
+    print(f'첫 응답 지연: {verification["first_response_latency"]}')
+    print(f'전체 지연: {verification["total_latency"]}')
+    print(f'이벤트 루프 지연: {results["event_loop_lag"]}')
+    print(f'설정 저장: {results["config_writes"]}')
+    print(f'결과 저장: {output}')
+
+
+if __name__ == "__main__":
+    main()
@@ -1,380 +1,1557 @@
+import time
+
+# 모듈을 불러오는 시간까지 재기 위해 가장 먼저 기록
+PROCESS_STARTED = time.perf_counter()
+
 import discord
 from discord import app_commands
 from discord.ext import commands
 import asyncio
+import bisect
+import contextlib
+import hashlib
 import random
 import json
+import logging
+import math
 import os
-from datetime import datetime
+import sys
+from collections import OrderedDict, deque
+from datetime import datetime, timezone
 
-intents = discord.Intents.default()
-intents.message_content = True
-intents.members = True
+try:
+    import resource
+except ImportError:
+    # Windows에는 resource 모듈이 없음 (메모리 사용량만 표시하지 않음)
+    resource = None
 
-bot = commands.Bot(command_prefix="!", intents=intents)
+# aiohttp.web(메트릭), sqlite3(sqlite 저장소), gzip/shutil(기록 압축)은 쓸 때 불러옴
+IMPORTS_FINISHED = time.perf_counter()
 
-CONFIG_FILE = "server_configs.json"
+# 빠른 시작 모드 (--fast-boot로도 켤 수 있음): uvloop과 orjson이 설치되어 있으면 사용
+FAST_BOOT = False
+if "--fast-boot" in sys.argv:
+    FAST_BOOT = True
+# 시작부터 첫 상호작용 처리까지 단계별 시간을 표로 출력
+PROFILE_STARTUP = "--profile-startup" in sys.argv
 
-server_configs = {}
+# 린 모드: 멤버 캐시와 시작 시 멤버 청킹을 끄고, 쓰지 않는 권한 인텐트(members, message_content)를 요청하지 않음
+# 인증은 상호작용에 포함된 멤버 정보만으로 처리하므로 그대로 동작하며 메모리와 시작 시간이 크게 줄어듦
+LEAN_MODE = False
 
+intents = discord.Intents.default()
+if not LEAN_MODE:
+    intents.message_content = True
+    intents.members = True
 
-def load_configs():
-    global server_configs
-    if os.path.exists(CONFIG_FILE):
-        with open(CONFIG_FILE, 'r', encoding='utf-8') as f:
-            server_configs = json.load(f)
-    else:
-        server_configs = {}
+# 샤딩 사용 여부 (서버가 많을 때 True), SHARD_COUNT가 None이면 디스코드 권장 샤드 수 사용
+USE_SHARDING = False
+SHARD_COUNT = None
 
+# 클러스터 모드 (python verified.py --cluster): 프로세스 CLUSTER_COUNT개가 샤드를 나눠 맡음
+# SHARD_COUNT를 지정하고 STORAGE_BACKEND를 "sqlite"로 바꿔야 함 (모든 프로세스가 같은 DB를 사용)
+CLUSTER_COUNT = 2
+# 프로세스 사이 설정 변경 알림용 유닉스 소켓
+CLUSTER_BUS_PATH = "verified-cluster.sock"
 
-def save_configs():
-    with open(CONFIG_FILE, 'w', encoding='utf-8') as f:
-        json.dump(server_configs, f, ensure_ascii=False, indent=2)
+# 런처가 실행한 프로세스에만 설정됨 (맡은 클러스터 번호, 샤드 목록, 전체 샤드 수)
+CLUSTER_ID = int(os.environ["VERIFIED_CLUSTER_ID"]) if "VERIFIED_CLUSTER_ID" in os.environ else None
+CLUSTER_SHARD_IDS = (
+    [int(shard_id) for shard_id in os.environ["VERIFIED_SHARD_IDS"].split(",")]
+    if "VERIFIED_SHARD_IDS" in os.environ else None
+)
+if "VERIFIED_SHARD_COUNT" in os.environ:
+    SHARD_COUNT = int(os.environ["VERIFIED_SHARD_COUNT"])
 
+# 로컬 메트릭 엔드포인트 (Prometheus 텍스트 형식, http://127.0.0.1:포트/metrics), None이면 끔
+METRICS_PORT = None
+METRICS_HOST = "127.0.0.1"
 
-def get_server_config(guild_id: int):
-    guild_id_str = str(guild_id)
-    if guild_id_str not in server_configs:
-        server_configs[guild_id_str] = {
-            "setup_complete": False,
-            "embed_title": "이것은 제목(Title)입니다.",
-            "embed_description": "이것은 내용입니다. 밑 세팅하기 눌러서 헥스코드(#제외)와 제목과 내용을 입력해주세요",
-            "embed_color": "00FF00",
-            "button_label": "인증하기",
-            "button_emoji": "🔐",
-            "verified_role_id": None,
-            "log_channel_id": None
-        }
-        save_configs()
-    return server_configs[guild_id_str]
+# 지연시간 히스토그램 구간(초)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
 
 
-class EmbedSettingModal(discord.ui.Modal, title="임베드 세팅"):
+class Histogram:
     
-    embed_title = discord.ui.TextInput(
-        label="임베드 제목",
-        placeholder="인증 시스템",
-        default="이것은 제목(Title)입니다.",
-        max_length=256,
-        required=True
-    )
+    __slots__ = ("bounds", "counts", "total", "count")
     
-    embed_description = discord.ui.TextInput(
-        label="임베드 내용",
-        placeholder="버튼을 눌러 인증하세요",
-        style=discord.TextStyle.paragraph,
-        default="이것은 내용입니다. 밑 세팅하기 눌러서 헥스코드(#제외)와 제목과 내용을 입력해주세요",
-        max_length=4000,
-        required=True
-    )
+    def __init__(self, bounds: tuple):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.total = 0.0
+        self.count = 0
     
-    embed_color = discord.ui.TextInput(
-        label="임베드 색상 (헥스코드, # 제외)",
-        placeholder="00FF00",
-        default="00FF00",
-        min_length=6,
-        max_length=6,
-        required=True
-    )
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.total += value
+        self.count += 1
+
+
+def _format_labels(labels: tuple):
+    if not labels:
+        return ""
+    parts = []
+    for name, value in labels:
+        value = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        parts.append(f'{name}="{value}"')
+    return "{" + ",".join(parts) + "}"
+
+
+def _format_value(value: float):
+    if math.isnan(value):
+        return "NaN"
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return str(value)
+
+
+class Metrics:
     
-    def __init__(self, guild_id: int):
-        super().__init__()
-        self.guild_id = guild_id
+    def __init__(self):
+        self._counters = {}
+        self._histograms = {}
+        self._collectors = []
     
-    async def on_submit(self, interaction: discord.Interaction):
-        config = get_server_config(self.guild_id)
-        config["embed_title"] = self.embed_title.value
-        config["embed_description"] = self.embed_description.value
-        config["embed_color"] = self.embed_color.value
-        save_configs()
-        
+    def inc(self, name: str, amount: float = 1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        self._counters[key] = self._counters.get(key, 0) + amount
+    
+    def observe(self, name: str, value: float, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        histogram = self._histograms.get(key)
+        if histogram is None:
+            histogram = self._histograms[key] = Histogram(LATENCY_BUCKETS)
+        histogram.observe(value)
+    
+    @contextlib.contextmanager
+    def timer(self, name: str, **labels):
+        started = time.perf_counter()
         try:
-            embed_color = int(self.embed_color.value, 16)
-        except:
-            embed_color = 0x00FF00
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started, **labels)
+    
+    def add_collector(self, collector):
+        # collector()는 (이름, 종류, 라벨 dict, 값) 목록을 돌려줌 - 렌더링할 때만 호출
+        self._collectors.append(collector)
+    
+    def render(self):
+        samples = {}
+        for (name, labels), value in self._counters.items():
+            samples.setdefault((name, "counter"), []).append((labels, value))
+        for collector in self._collectors:
+            for name, kind, labels, value in collector():
+                samples.setdefault((name, kind), []).append((tuple(sorted(labels.items())), value))
         
-        updated_embed = discord.Embed(
-            title=self.embed_title.value,
-            description=self.embed_description.value,
-            color=embed_color
-        )
+        lines = []
+        for (name, kind), values in sorted(samples.items()):
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in sorted(values, key=lambda item: item[0]):
+                lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
         
-        view = SetupStep1View(self.guild_id)
+        histograms = {}
+        for (name, labels), histogram in self._histograms.items():
+            histograms.setdefault(name, []).append((labels, histogram))
+        for name, values in sorted(histograms.items()):
+            lines.append(f"# TYPE {name} histogram")
+            for labels, histogram in sorted(values, key=lambda item: item[0]):
+                cumulative = 0
+                for bound, count in zip(histogram.bounds, histogram.counts):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{_format_labels(labels + (('le', bound),))} {cumulative}")
+                lines.append(f"{name}_bucket{_format_labels(labels + (('le', '+Inf'),))} {histogram.count}")
+                lines.append(f"{name}_sum{_format_labels(labels)} {histogram.total}")
+                lines.append(f"{name}_count{_format_labels(labels)} {histogram.count}")
         
-        await interaction.response.edit_message(embed=updated_embed, view=view)
+        return "\n".join(lines) + "\n"
 
 
-class ButtonSettingModal(discord.ui.Modal, title="버튼 세팅"):
+metrics = Metrics()
+
+
+class RateLimitCounter(logging.Filter):
     
-    button_label = discord.ui.TextInput(
-        label="버튼 텍스트",
-        placeholder="인증하기",
-        default="인증하기",
-        max_length=80,
-        required=True
+    # discord.py가 429를 받으면 discord.http 로거에 경고를 남기므로 그걸 세어둠
+    def filter(self, record: logging.LogRecord):
+        if isinstance(record.msg, str) and "responded with 429" in record.msg:
+            metrics.inc("verified_rest_429_total", source="discord_http")
+        return True
+
+
+logging.getLogger("discord.http").addFilter(RateLimitCounter())
+
+
+async def _metrics_handler(request):
+    from aiohttp import web
+    return web.Response(
+        body=metrics.render().encode('utf-8'),
+        headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"}
     )
+
+
+async def start_metrics_server():
+    # 클러스터 모드에서는 프로세스마다 포트를 하나씩 올려서 사용
+    from aiohttp import web
     
-    button_emoji = discord.ui.TextInput(
-        label="버튼 이모지 (선택사항)",
-        placeholder="🔐",
-        default="🔐",
-        max_length=2,
-        required=False
-    )
+    port = METRICS_PORT + (CLUSTER_ID or 0)
+    app = web.Application()
+    app.router.add_get("/metrics", _metrics_handler)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, METRICS_HOST, port).start()
+    print(f'메트릭 엔드포인트: http://{METRICS_HOST}:{port}/metrics')
+    return runner
+
+
+class VerifiedCommandTree(app_commands.CommandTree):
     
-    def __init__(self, guild_id: int):
-        super().__init__()
-        self.guild_id = guild_id
+    async def interaction_check(self, interaction: discord.Interaction):
+        # 명령어 처리 시간 측정용 (on_app_command_completion에서 사용)
+        interaction.extras["started_at"] = time.perf_counter()
+        return True
+
+
+class VerifiedBotMixin:
     
-    async def on_submit(self, interaction: discord.Interaction):
-        config = get_server_config(self.guild_id)
-        config["button_label"] = self.button_label.value
-        config["button_emoji"] = self.button_emoji.value if self.button_emoji.value else None
-        save_configs()
+    metrics_runner = None
+    config_watcher = None
+    config_gc = None
+    
+    async def setup_hook(self):
+        # 프로세스당 한 번만 실행됨 (재연결 시에는 실행되지 않음)
+        hook_started = time.perf_counter()
+        record_startup_phase("모듈 불러오기", PROCESS_STARTED, IMPORTS_FINISHED)
+        record_startup_phase("봇 생성", BOT_CREATE_STARTED, BOT_CREATED)
+        if RUN_STARTED is not None:
+            record_startup_phase("나머지 모듈 초기화", BOT_CREATED, RUN_STARTED)
+            record_startup_phase("로그인", RUN_STARTED, hook_started)
         
-        try:
-            embed_color = int(config["embed_color"], 16)
-        except:
-            embed_color = 0x00FF00
+        started = time.perf_counter()
+        load_configs()
+        record_startup_phase("설정 불러오기", started)
         
-        updated_embed = discord.Embed(
-            title=config["embed_title"],
-            description=config["embed_description"],
-            color=embed_color
-        )
+        started = time.perf_counter()
+        verification_audit.load()
+        record_startup_phase("인증 기록 불러오기", started)
         
-        view = SetupStep1View(self.guild_id)
+        backfill_manager.load_checkpoints()
         
-        await interaction.response.edit_message(embed=updated_embed, view=view)
+        if CLUSTER_ID is not None:
+            await connect_cluster_bus()
+        
+        self.add_dynamic_items(VerifyButton)
+        
+        started = time.perf_counter()
+        await sync_command_tree()
+        record_startup_phase("명령어 동기화", started)
+        
+        if CONFIG_RELOAD_INTERVAL is not None:
+            self.config_watcher = asyncio.ensure_future(watch_configs(CONFIG_RELOAD_INTERVAL))
+        if CONFIG_GC_INTERVAL is not None:
+            self.config_gc = asyncio.ensure_future(run_config_gc(CONFIG_GC_INTERVAL))
+        if METRICS_PORT is not None:
+            self.metrics_runner = await start_metrics_server()
+        self.setup_finished_at = time.perf_counter()
+    
+    async def close(self):
+        # 종료 전에 모아둔 인증 로그를 보내고 저장 대기 중인 설정을 디스크에 기록
+        backfill_manager.cancel_all()
+        if self.config_watcher is not None:
+            self.config_watcher.cancel()
+        if self.config_gc is not None:
+            self.config_gc.cancel()
+        await verification_log_writer.flush_all()
+        await verification_audit.flush(save_counters=True)
+        await flush_configs()
+        await super().close()
+        close_config_backend()
+        if cluster_bus is not None:
+            await cluster_bus.close()
+        if self.metrics_runner is not None:
+            await self.metrics_runner.cleanup()
 
 
-class LogChannelModal(discord.ui.Modal, title="로그 채널 설정"):
+class VerifiedBot(VerifiedBotMixin, commands.Bot):
+    pass
+
+
+class VerifiedShardedBot(VerifiedBotMixin, commands.AutoShardedBot):
+    pass
+
+
+def create_bot():
+    options = {}
+    if LEAN_MODE:
+        options["chunk_guilds_at_startup"] = False
+        options["member_cache_flags"] = discord.MemberCacheFlags.none()
     
-    channel_id = discord.ui.TextInput(
-        label="채널 ID",
-        placeholder="1234567890123456789",
-        min_length=17,
-        max_length=20,
-        required=True
-    )
+    if CLUSTER_SHARD_IDS is not None:
+        return VerifiedShardedBot(
+            command_prefix="!",
+            intents=intents,
+            shard_ids=CLUSTER_SHARD_IDS,
+            shard_count=SHARD_COUNT,
+            tree_cls=VerifiedCommandTree,
+            **options
+        )
+    if USE_SHARDING:
+        return VerifiedShardedBot(
+            command_prefix="!",
+            intents=intents,
+            shard_count=SHARD_COUNT,
+            tree_cls=VerifiedCommandTree,
+            **options
+        )
+    return VerifiedBot(command_prefix="!", intents=intents, tree_cls=VerifiedCommandTree, **options)
+
+
+BOT_CREATE_STARTED = time.perf_counter()
+bot = create_bot()
+BOT_CREATED = time.perf_counter()
+
+CONFIG_FILE = "server_configs.json"
+
+# 설정 저장소: "json" (server_configs.json) 또는 "sqlite" (길드별 행 단위 저장)
+STORAGE_BACKEND = "json"
+SQLITE_FILE = "server_configs.db"
+
+# 변경 후 이 시간(초) 동안 모인 변경사항을 한 번에 저장
+SAVE_DEBOUNCE_SECONDS = 2.0
+# 저장에 실패하면 간격을 두 배씩 늘려가며 다시 시도 (최대 간격, 초)
+SAVE_RETRY_MAX_SECONDS = 60.0
+
+# 설정 저장/불러오기용 JSON 코덱: "json"(표준 라이브러리) 또는 "orjson"
+# 빠른 시작 모드에서는 orjson이 설치되어 있으면 자동으로 사용
+JSON_CODEC = "json"
+
+
+class StdlibJsonCodec:
     
-    def __init__(self, guild_id: int):
-        super().__init__()
-        self.guild_id = guild_id
+    name = "json"
     
-    async def on_submit(self, interaction: discord.Interaction):
-        try:
-            channel_id = int(self.channel_id.value)
-            channel = interaction.guild.get_channel(channel_id)
-            
-            if not channel:
-                await interaction.response.send_message(
-                    "❌ 해당 ID의 채널을 찾을 수 없습니다. 올바른 채널 ID를 입력해주세요.",
-                    ephemeral=True
-                )
-                return
-            
-            if not isinstance(channel, discord.TextChannel):
-                await interaction.response.send_message(
-                    "❌ 텍스트 채널 ID를 입력해주세요.",
-                    ephemeral=True
-                )
-                return
-            
-            config = get_server_config(self.guild_id)
-            config["log_channel_id"] = channel_id
-            save_configs()
-            
-            await interaction.response.send_message(
-                f"✅ 로그 채널이 {channel.mention}(으)로 설정되었습니다!",
-                ephemeral=True
-            )
-        except ValueError:
-            await interaction.response.send_message(
-                "❌ 올바른 채널 ID를 입력해주세요.",
-                ephemeral=True
-            )
+    def loads(self, data):
+        return json.loads(data)
+    
+    def dumps(self, obj, pretty: bool = False):
+        return json.dumps(obj, ensure_ascii=False, indent=2 if pretty else None)
 
 
-class SetupStartView(discord.ui.View):
+class OrjsonCodec:
     
-    def __init__(self, guild_id: int):
-        super().__init__(timeout=300)
-        self.guild_id = guild_id
+    name = "orjson"
     
-    @discord.ui.button(label="시작하기", style=discord.ButtonStyle.green, emoji="✅")
-    async def start_button(
-        self,
-        interaction: discord.Interaction,
-        button: discord.ui.Button
-    ):
-        view = SetupStep1View(self.guild_id)
-        
-        config = get_server_config(self.guild_id)
+    def __init__(self, module):
+        self.orjson = module
+    
+    def loads(self, data):
+        return self.orjson.loads(data)
+    
+    def dumps(self, obj, pretty: bool = False):
+        option = self.orjson.OPT_NON_STR_KEYS
+        if pretty:
+            option |= self.orjson.OPT_INDENT_2
+        return self.orjson.dumps(obj, option=option).decode('utf-8')
+
+
+def create_json_codec():
+    if FAST_BOOT or JSON_CODEC == "orjson":
         try:
-            embed_color = int(config["embed_color"], 16)
-        except:
-            embed_color = 0x00FF00
-        
-        embed = discord.Embed(
-            title=config["embed_title"],
-            description=config["embed_description"],
-            color=embed_color
-        )
-        
-        await interaction.response.edit_message(embed=embed, view=view)
+            import orjson
+        except ImportError:
+            print('orjson이 설치되어 있지 않아 기본 json 모듈을 사용합니다.')
+        else:
+            return OrjsonCodec(orjson)
+    return StdlibJsonCodec()
+
+
+config_codec = create_json_codec()
+
+# 모든 서버가 공유하는 기본 설정 - 서버별로는 이 값과 다른 항목만 저장함
+DEFAULT_CONFIG = {
+    "setup_complete": False,
+    "embed_title": "이것은 제목(Title)입니다.",
+    "embed_description": "이것은 내용입니다. 밑 세팅하기 눌러서 헥스코드(#제외)와 제목과 내용을 입력해주세요",
+    "embed_color": "00FF00",
+    "button_label": "인증하기",
+    "button_emoji": "🔐",
+    "verified_role_id": None,
+    "log_channel_id": None,
+    "verification_mode": "fast"
+}
+
+# 이 간격(초)마다 설정 파일/DB가 밖에서 바뀌었는지 확인해서 다시 불러옴 (None이면 끔)
+CONFIG_RELOAD_INTERVAL = 2.0
+
+server_configs = {}
 
+config_backend = None
 
-class SetupStep1View(discord.ui.View):
+# 클러스터 모드에서 다른 프로세스와 설정 변경을 주고받는 연결
+cluster_bus = None
+
+# 저장 대기 중인 길드 ID
+_dirty_guilds = set()
+_flush_handle = None
+_flush_task = None
+_flush_failures = 0
+_flush_lock = asyncio.Lock()
+
+# 저장 통계 (지연시간은 ms)
+save_stats = {
+    "flush_count": 0,
+    "flush_errors": 0,
+    "bytes_written": 0,
+    "last_flush_ms": 0.0,
+    "max_flush_ms": 0.0,
+    "total_flush_ms": 0.0
+}
+
+# 설정 다시 불러오기 통계
+reload_stats = {
+    "reloads": 0,
+    "guilds_changed": 0,
+    "guilds_kept": 0,
+    "errors": 0
+}
+
+
+class JsonConfigBackend:
     
-    def __init__(self, guild_id: int):
-        super().__init__(timeout=None)
-        self.guild_id = guild_id
-        
-        config = get_server_config(guild_id)
-        button_label = config.get("button_label", "인증하기")
-        button_emoji = config.get("button_emoji", "🔐")
-        
-        preview_button = discord.ui.Button(
-            label=button_label,
-            style=discord.ButtonStyle.primary,
-            emoji=button_emoji,
-            disabled=True,
-            row=0
-        )
-        self.add_item(preview_button)
+    # 저장할 때마다 전체 설정이 필요함
+    full_snapshot = True
     
-    @discord.ui.button(label="세팅하기", style=discord.ButtonStyle.secondary, row=1)
-    async def embed_setting_button(
-        self,
-        interaction: discord.Interaction,
-        button: discord.ui.Button
-    ):
-        modal = EmbedSettingModal(self.guild_id)
-        await interaction.response.send_modal(modal)
+    def __init__(self, path: str):
+        self.path = path
+        # 마지막으로 읽거나 쓴 시점의 파일 상태 (밖에서 바뀌었는지 비교용)
+        self.known_state = None
     
-    @discord.ui.button(label="버튼 세팅하기", style=discord.ButtonStyle.secondary, row=1)
-    async def button_setting_button(
-        self,
-        interaction: discord.Interaction,
-        button: discord.ui.Button
-    ):
-        modal = ButtonSettingModal(self.guild_id)
-        await interaction.response.send_modal(modal)
+    def _file_state(self):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
     
-    @discord.ui.button(label="다음", style=discord.ButtonStyle.green, row=1)
-    async def next_button(
-        self,
-        interaction: discord.Interaction,
-        button: discord.ui.Button
-    ):
-        view = SetupStep2View(self.guild_id, interaction.guild)
-        
-        embed = discord.Embed(
-            title="역할 선택",
-            description=(
-                "완벽해요 ! 클릭시 지급할 역할을 선택해주세요\n"
-                "(봇 역할이 지급될 역할보다 낮다면 지급이 불가능해요 !)"
-            ),
-            color=discord.Color.blue()
-        )
+    def load_all(self):
+        self.known_state = self._file_state()
+        if os.path.exists(self.path):
+            with open(self.path, 'rb') as f:
+                return config_codec.loads(f.read())
+        return {}
+    
+    def poll_changes(self):
+        # 파일이 바뀌었으면 전체 설정을 돌려줌 (전체이므로 삭제된 서버도 알 수 있음)
+        state = self._file_state()
+        if state is None or state == self.known_state:
+            return None
+        with open(self.path, 'rb') as f:
+            configs = config_codec.loads(f.read())
+        self.known_state = state
+        return configs, True
+    
+    def dump_all(self):
+        return self.load_all()
+    
+    def stored_bytes(self):
+        return os.path.getsize(self.path) if os.path.exists(self.path) else 0
+    
+    def load(self, guild_id: str):
+        # 시작할 때 전부 불러오므로 따로 조회할 필요 없음
+        return None
+    
+    def load_many(self, guild_ids: list):
+        return {}
+    
+    def write(self, snapshot: dict):
+        data = config_codec.dumps(snapshot, pretty=True).encode('utf-8')
         
-        await interaction.response.edit_message(embed=embed, view=view)
+        # 임시 파일에 쓴 뒤 교체해서 저장 도중 종료되어도 파일이 깨지지 않도록 함
+        tmp_path = f"{self.path}.tmp"
+        try:
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+        except OSError:
+            # 실패한 임시 파일은 남기지 않음
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+        self.known_state = self._file_state()
+        return len(data)
+    
+    def close(self):
+        pass
 
 
-class SetupStep2View(discord.ui.View):
+class SqliteConfigBackend:
     
-    def __init__(self, guild_id: int, guild: discord.Guild):
-        super().__init__(timeout=None)
-        self.guild_id = guild_id
-        self.add_item(RoleSelectMenu(guild_id, guild))
+    # 변경된 길드만 저장함
+    full_snapshot = False
     
-    @discord.ui.button(label="다음", style=discord.ButtonStyle.green)
-    async def next_button(
-        self,
-        interaction: discord.Interaction,
-        button: discord.ui.Button
-    ):
-        config = get_server_config(self.guild_id)
-        
-        if not config.get("verified_role_id"):
-            await interaction.response.send_message(
-                "❌ 먼저 역할을 선택해주세요!",
-                ephemeral=True
-            )
-            return
-        
-        view = SetupStep3View(self.guild_id)
+    def __init__(self, path: str, json_path: str = None):
+        import sqlite3
         
-        embed = discord.Embed(
-            title="로그 채널 설정",
-            description="이제 마지막 !! 로그 채널을 설정해주세요",
-            color=discord.Color.blue()
+        self.path = path
+        # 조회는 이벤트 루프에서, 저장은 작업 스레드에서 각자의 연결로 처리 (WAL)
+        self.writer = sqlite3.connect(path, check_same_thread=False)
+        self.writer.execute("PRAGMA journal_mode=WAL")
+        self.writer.execute("PRAGMA synchronous=NORMAL")
+        self.writer.execute(
+            "CREATE TABLE IF NOT EXISTS guild_configs ("
+            "guild_id INTEGER PRIMARY KEY, "
+            "data TEXT NOT NULL, "
+            "updated_at REAL NOT NULL)"
         )
+        self.writer.execute(
+            "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)"
+        )
+        self.writer.commit()
+        self.reader = sqlite3.connect(path, check_same_thread=False)
         
-        await interaction.response.edit_message(embed=embed, view=view)
-
-
-class RoleSelectMenu(discord.ui.Select):
-    
-    def __init__(self, guild_id: int, guild: discord.Guild):
-        self.guild_id = guild_id
-        
-        options = []
-        for role in guild.roles:
-            if role.name != "@everyone" and not role.managed:
-                options.append(
-                    discord.SelectOption(
-                        label=role.name,
-                        value=str(role.id),
-                        description=f"ID: {role.id}"
-                    )
-                )
+        if json_path:
+            self._import_json(json_path)
         
-        options = options[:25]
+        # 이 시각 이후로 바뀐 행만 다시 불러옴
+        row = self.writer.execute("SELECT MAX(updated_at) FROM guild_configs").fetchone()
+        self.known_updated_at = row[0] or 0.0
+    
+    def _import_json(self, json_path: str):
+        row = self.writer.execute(
+            "SELECT value FROM meta WHERE key = 'json_imported'"
+        ).fetchone()
+        if row or not os.path.exists(json_path):
+            return
         
-        if not options:
-            options = [
-                discord.SelectOption(
-                    label="역할이 없습니다",
-                    value="0",
-                    description="서버에 역할을 먼저 생성해주세요"
-                )
-            ]
+        with open(json_path, 'rb') as f:
+            configs = config_codec.loads(f.read())
+        
+        now = time.time()
+        with self.writer:
+            self.writer.executemany(
+                "INSERT OR IGNORE INTO guild_configs (guild_id, data, updated_at) VALUES (?, ?, ?)",
+                [
+                    (int(guild_id), config_codec.dumps(config), now)
+                    for guild_id, config in configs.items()
+                ]
+            )
+            self.writer.execute(
+                "INSERT INTO meta (key, value) VALUES ('json_imported', ?)",
+                (json_path,)
+            )
+        print(f'{json_path}에서 {len(configs)}개 서버 설정을 가져왔습니다.')
+    
+    def load_all(self):
+        # 필요할 때 길드 단위로 불러옴
+        return {}
+    
+    def dump_all(self):
+        rows = self.reader.execute("SELECT guild_id, data FROM guild_configs")
+        return {str(guild_id): config_codec.loads(data) for guild_id, data in rows}
+    
+    def scan(self, after: int, limit: int):
+        # 정리 작업용: 길드 ID 순서로 일부씩 읽음 (저장과 같은 잠금 안에서 작업 스레드로 실행)
+        rows = self.writer.execute(
+            "SELECT guild_id, data FROM guild_configs WHERE guild_id > ? ORDER BY guild_id LIMIT ?",
+            (after, limit)
+        ).fetchall()
+        return [(str(guild_id), config_codec.loads(data)) for guild_id, data in rows]
+    
+    def stored_bytes(self):
+        row = self.reader.execute("SELECT SUM(LENGTH(CAST(data AS BLOB))) FROM guild_configs").fetchone()
+        return row[0] or 0
+    
+    def load(self, guild_id: str):
+        row = self.reader.execute(
+            "SELECT data FROM guild_configs WHERE guild_id = ?",
+            (int(guild_id),)
+        ).fetchone()
+        return config_codec.loads(row[0]) if row else None
+    
+    def load_many(self, guild_ids: list):
+        configs = {}
+        for i in range(0, len(guild_ids), 500):
+            chunk = [int(guild_id) for guild_id in guild_ids[i:i + 500]]
+            placeholders = ", ".join("?" * len(chunk))
+            rows = self.reader.execute(
+                f"SELECT guild_id, data FROM guild_configs WHERE guild_id IN ({placeholders})",
+                chunk
+            )
+            for guild_id, data in rows:
+                configs[str(guild_id)] = config_codec.loads(data)
+        return configs
+    
+    def poll_changes(self):
+        # 밖에서 수정할 때는 updated_at도 함께 갱신해야 반영됨
+        # 저장과 같은 잠금 안에서 작업 스레드로 실행되므로 저장용 연결을 사용
+        rows = self.writer.execute(
+            "SELECT guild_id, data, updated_at FROM guild_configs WHERE updated_at > ?",
+            (self.known_updated_at,)
+        ).fetchall()
+        if not rows:
+            return None
+        self.known_updated_at = max(row[2] for row in rows)
+        return {str(guild_id): config_codec.loads(data) for guild_id, data, _ in rows}, False
+    
+    def write(self, changes: dict):
+        now = time.time()
+        upserts = []
+        deletes = []
+        written = 0
+        for guild_id, config in changes.items():
+            if config is None:
+                deletes.append((int(guild_id),))
+                continue
+            data = config_codec.dumps(config)
+            written += len(data.encode('utf-8'))
+            upserts.append((int(guild_id), data, now))
+        
+        with self.writer:
+            self.writer.executemany(
+                "INSERT INTO guild_configs (guild_id, data, updated_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(guild_id) DO UPDATE SET data = excluded.data, updated_at = excluded.updated_at",
+                upserts
+            )
+            if deletes:
+                self.writer.executemany("DELETE FROM guild_configs WHERE guild_id = ?", deletes)
+        return written
+    
+    def close(self):
+        self.reader.close()
+        self.writer.close()
+
+
+def create_config_backend():
+    if STORAGE_BACKEND == "sqlite":
+        return SqliteConfigBackend(SQLITE_FILE, json_path=CONFIG_FILE)
+    return JsonConfigBackend(CONFIG_FILE)
+
+
+def _get_backend():
+    global config_backend
+    if config_backend is None:
+        config_backend = create_config_backend()
+    return config_backend
+
+
+def close_config_backend():
+    global config_backend
+    if config_backend is not None:
+        config_backend.close()
+        config_backend = None
+
+
+def compact_config(config: dict):
+    # 기본값과 같은 항목을 뺀 차이만 남김
+    return {
+        key: value for key, value in config.items()
+        if key not in DEFAULT_CONFIG or DEFAULT_CONFIG[key] != value
+    }
+
+
+def _compact_all(configs: dict):
+    return {guild_id: compact_config(config) for guild_id, config in configs.items()}
+
+
+def load_configs():
+    global server_configs
+    server_configs = _compact_all(_get_backend().load_all())
+    _compiled_configs.clear()
+
+
+def compact_configs():
+    # 예전 형식(기본값까지 전부 저장)의 설정을 한 번에 정리하고 크기를 보고
+    backend = _get_backend()
+    configs = backend.dump_all()
+    before_bytes = backend.stored_bytes()
+    
+    compacted = _compact_all(configs)
+    if backend.full_snapshot:
+        backend.write({guild_id: config for guild_id, config in compacted.items() if config})
+    else:
+        backend.write({
+            guild_id: config or None
+            for guild_id, config in compacted.items()
+            if config != configs[guild_id]
+        })
+    
+    after_bytes = backend.stored_bytes()
+    kept = sum(1 for config in compacted.values() if config)
+    report = {
+        "guilds_before": len(configs),
+        "guilds_after": kept,
+        "bytes_before": before_bytes,
+        "bytes_after": after_bytes
+    }
+    saved = (1 - after_bytes / before_bytes) * 100 if before_bytes else 0.0
+    print(
+        f'설정 정리 완료: 서버 {len(configs)}개 → {kept}개, '
+        f'{before_bytes:,}바이트 → {after_bytes:,}바이트 ({saved:.1f}% 감소)'
+    )
+    return report
+
+
+def _record_flush(started: float, written: int):
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    save_stats["flush_count"] += 1
+    save_stats["bytes_written"] += written
+    save_stats["last_flush_ms"] = elapsed_ms
+    save_stats["max_flush_ms"] = max(save_stats["max_flush_ms"], elapsed_ms)
+    save_stats["total_flush_ms"] += elapsed_ms
+    metrics.observe("verified_config_save_seconds", elapsed_ms / 1000)
+    metrics.inc("verified_config_save_bytes_total", written)
+
+
+def _take_snapshot(backend):
+    dirty = set(_dirty_guilds)
+    _dirty_guilds.clear()
+    
+    # 기본값에서 바뀐 것이 없거나 정리된 서버는 저장하지 않음 (sqlite는 행을 지움)
+    if backend.full_snapshot:
+        return {guild_id: dict(config) for guild_id, config in server_configs.items() if config}
+    
+    return {
+        guild_id: dict(server_configs.get(guild_id) or {}) or None
+        for guild_id in dirty
+    }
+
+
+def _apply_config_changes(configs: dict, complete: bool, keep_unloaded: bool):
+    # 저장 대기 중인 서버는 메모리의 값이 우선 (곧 저장되면서 파일에도 반영됨)
+    changed = 0
+    kept = 0
+    for guild_id, config in configs.items():
+        if guild_id in _dirty_guilds:
+            kept += 1
+            continue
+        current = server_configs.get(guild_id)
+        if current == config:
+            continue
+        # 아직 불러오지 않은 서버는 필요할 때 저장소에서 읽으면 되므로 건너뜀
+        # (기본값으로 만들어 둔 설정이 남지 않도록 캐시는 비움)
+        if current is None and not keep_unloaded:
+            _compiled_configs.pop(guild_id, None)
+            continue
+        server_configs[guild_id] = config
+        _compiled_configs.pop(guild_id, None)
+        changed += 1
+    
+    if complete:
+        removed = [
+            guild_id for guild_id in server_configs
+            if guild_id not in configs and guild_id not in _dirty_guilds
+        ]
+        for guild_id in removed:
+            del server_configs[guild_id]
+            _compiled_configs.pop(guild_id, None)
+        changed += len(removed)
+    
+    reload_stats["guilds_changed"] += changed
+    reload_stats["guilds_kept"] += kept
+    return changed
+
+
+async def _reload_configs_locked(backend):
+    try:
+        result = await asyncio.to_thread(backend.poll_changes)
+    except Exception as e:
+        # 다른 프로그램이 쓰는 도중이면 다음 확인 때 다시 시도
+        reload_stats["errors"] += 1
+        print(f'설정 다시 불러오기 중 오류 발생: {e}')
+        return 0
+    if result is None:
+        return 0
+    
+    configs, complete = result
+    changed = _apply_config_changes(_compact_all(configs), complete, backend.full_snapshot)
+    if changed:
+        reload_stats["reloads"] += 1
+        print(f'바뀐 설정을 다시 불러왔습니다: 서버 {changed}개')
+    return changed
+
+
+async def reload_configs():
+    async with _flush_lock:
+        return await _reload_configs_locked(_get_backend())
+
+
+async def watch_configs(interval: float):
+    while True:
+        await asyncio.sleep(interval)
+        await reload_configs()
+
+
+async def flush_configs():
+    global _flush_handle, _flush_failures
+    
+    async with _flush_lock:
+        if not _dirty_guilds:
+            return
+        
+        backend = _get_backend()
+        if backend.full_snapshot:
+            # 전체를 덮어쓰기 전에 밖에서 수정된 내용을 먼저 반영해서 잃어버리지 않도록 함
+            await _reload_configs_locked(backend)
+        dirty = set(_dirty_guilds)
+        snapshot = _take_snapshot(backend)
+        started = time.perf_counter()
+        try:
+            written = await asyncio.to_thread(backend.write, snapshot)
+        except Exception as e:
+            save_stats["flush_errors"] += 1
+            metrics.inc("verified_config_save_errors_total")
+            _dirty_guilds.update(dirty)
+            # 디스크 공간 부족이나 파일 잠금 같은 일시적인 오류일 수 있으므로 다시 저장 예약
+            _flush_failures += 1
+            delay = min(SAVE_DEBOUNCE_SECONDS * 2 ** _flush_failures, SAVE_RETRY_MAX_SECONDS)
+            if _flush_handle is None:
+                _flush_handle = asyncio.get_running_loop().call_later(delay, _start_flush)
+            print(f'설정 저장 중 오류 발생 ({delay:.0f}초 후 다시 시도): {e}')
+            return
+        
+        _flush_failures = 0
+        _record_flush(started, written)
+        
+        # 저장이 끝난 뒤에 알려야 다른 프로세스가 새 값을 읽음
+        if cluster_bus is not None:
+            cluster_bus.publish(dirty)
+
+
+def flush_configs_sync():
+    if not _dirty_guilds:
+        return
+    
+    backend = _get_backend()
+    snapshot = _take_snapshot(backend)
+    started = time.perf_counter()
+    written = backend.write(snapshot)
+    _record_flush(started, written)
+
+
+def _start_flush():
+    global _flush_handle, _flush_task
+    _flush_handle = None
+    _flush_task = asyncio.ensure_future(flush_configs())
+
+
+def save_configs(guild_id: int = None):
+    global _flush_handle
+    
+    if guild_id is None:
+        _dirty_guilds.update(server_configs)
+    else:
+        _dirty_guilds.add(str(guild_id))
+    
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        # 이벤트 루프 밖에서는 바로 저장
+        flush_configs_sync()
+        return
+    
+    if _flush_handle is None:
+        _flush_handle = loop.call_later(SAVE_DEBOUNCE_SECONDS, _start_flush)
+
+
+def _get_config_delta(guild_id_str: str):
+    delta = server_configs.get(guild_id_str)
+    if delta is None:
+        stored = _get_backend().load(guild_id_str)
+        if stored is not None:
+            delta = server_configs[guild_id_str] = compact_config(stored)
+    return delta
+
+
+def get_server_config(guild_id: int):
+    # 기본값에 서버별 차이를 덮어쓴 새 dict (수정은 update_server_config로)
+    # 한 번도 바꾸지 않은 서버는 메모리/파일에 아무것도 남기지 않음
+    delta = _get_config_delta(str(guild_id))
+    if not delta:
+        return dict(DEFAULT_CONFIG)
+    return {**DEFAULT_CONFIG, **delta}
+
+
+def update_server_config(guild_id: int, **changes):
+    guild_id_str = str(guild_id)
+    config = get_server_config(guild_id)
+    changed = {key: value for key, value in changes.items() if config.get(key) != value}
+    if not changed:
+        return False
+    
+    delta = server_configs.setdefault(guild_id_str, {})
+    for key, value in changed.items():
+        if key in DEFAULT_CONFIG and DEFAULT_CONFIG[key] == value:
+            delta.pop(key, None)
+        else:
+            delta[key] = value
+    # 세팅을 만지는 중이면 미완료 기한을 다시 계산 (정리 작업이 새로 기록함)
+    delta.pop("incomplete_since", None)
+    _compiled_configs.pop(guild_id_str, None)
+    save_configs(guild_id)
+    return True
+
+
+DEFAULT_EMBED_COLOR = 0x00FF00
+
+
+class CompiledConfig:
+    
+    # 자주 읽는 값을 미리 파싱해 둔 읽기 전용 설정 (embed도 한 번만 생성)
+    __slots__ = (
+        "guild_id",
+        "setup_complete",
+        "embed_title",
+        "embed_description",
+        "embed_color",
+        "button_label",
+        "button_emoji",
+        "verified_role_id",
+        "log_channel_id",
+        "verification_mode",
+        "admission_rate",
+        "admission_burst",
+        "embed"
+    )
+    
+    def __init__(self, guild_id: int, config: dict):
+        try:
+            embed_color = int(config["embed_color"], 16)
+        except (KeyError, TypeError, ValueError):
+            embed_color = DEFAULT_EMBED_COLOR
+        
+        values = {
+            "guild_id": guild_id,
+            "setup_complete": bool(config.get("setup_complete")),
+            "embed_title": config["embed_title"],
+            "embed_description": config["embed_description"],
+            "embed_color": embed_color,
+            "button_label": config.get("button_label", "인증하기"),
+            "button_emoji": config.get("button_emoji", "🔐"),
+            "verified_role_id": config.get("verified_role_id"),
+            "log_channel_id": config.get("log_channel_id"),
+            "verification_mode": config.get("verification_mode", "fast"),
+            "admission_rate": config.get("admission_rate") or ADMISSION_DEFAULT_RATE,
+            "admission_burst": config.get("admission_burst") or ADMISSION_DEFAULT_BURST,
+            # 공유되는 객체이므로 수정하지 말고 그대로 보낼 것
+            "embed": discord.Embed(
+                title=config["embed_title"],
+                description=config["embed_description"],
+                color=embed_color
+            )
+        }
+        for name, value in values.items():
+            object.__setattr__(self, name, value)
+    
+    def __setattr__(self, name, value):
+        raise AttributeError("CompiledConfig는 수정할 수 없습니다. update_server_config()를 사용하세요.")
+    
+    def __delattr__(self, name):
+        raise AttributeError("CompiledConfig는 수정할 수 없습니다. update_server_config()를 사용하세요.")
+
+
+_compiled_configs = {}
+
+
+def get_compiled_config(guild_id: int):
+    guild_id_str = str(guild_id)
+    compiled = _compiled_configs.get(guild_id_str)
+    if compiled is None:
+        compiled = CompiledConfig(int(guild_id), get_server_config(guild_id))
+        _compiled_configs[guild_id_str] = compiled
+    return compiled
+
+
+def warm_guild_configs(guild_ids: list):
+    # 설정이 있는 서버만 미리 불러오고 컴파일 (없는 서버에 기본값을 만들지 않음)
+    missing = [str(guild_id) for guild_id in guild_ids if str(guild_id) not in server_configs]
+    if missing:
+        server_configs.update(_compact_all(_get_backend().load_many(missing)))
+    
+    warmed = 0
+    for guild_id in guild_ids:
+        if str(guild_id) in server_configs:
+            get_compiled_config(guild_id)
+            warmed += 1
+    return warmed
+
+
+# 봇이 나간 서버와 세팅을 끝내지 않은 서버의 설정을 이 시간(초)이 지나면 삭제
+CONFIG_TTL = 30 * 24 * 3600
+# 정리 작업 간격(초, None이면 끔)과 한 번에 확인할 서버 수 (사이사이 이벤트 루프에 양보)
+CONFIG_GC_INTERVAL = 3600
+CONFIG_GC_BATCH = 500
+
+# 정리 작업 통계
+gc_stats = {
+    "runs": 0,
+    "scanned": 0,
+    "tombstoned": 0,
+    "restored": 0,
+    "purged": 0,
+    "last_run": None
+}
+
+
+def _owns_guild(guild_id: int):
+    # 이 프로세스가 맡은 샤드의 서버인지 (다른 프로세스 서버를 나간 서버로 착각하지 않도록)
+    shard_count = bot.shard_count or 1
+    if shard_count == 1:
+        return True
+    shard_ids = getattr(bot, "shard_ids", None)
+    return shard_ids is None or (guild_id >> 22) % shard_count in shard_ids
+
+
+def tombstone_guild_config(guild_id: int):
+    delta = _get_config_delta(str(guild_id))
+    if not delta or "removed_at" in delta:
+        return False
+    delta["removed_at"] = time.time()
+    save_configs(guild_id)
+    return True
+
+
+def restore_guild_config(guild_id: int):
+    delta = _get_config_delta(str(guild_id))
+    if not delta or delta.pop("removed_at", None) is None:
+        return False
+    save_configs(guild_id)
+    return True
+
+
+def _sweep_entry(guild_id_str: str, delta: dict, now: float, present: bool):
+    # 서버 하나의 설정 수명 관리 - 바뀌면 저장 대상으로 표시
+    expire_before = now - CONFIG_TTL
+    
+    removed_at = delta.get("removed_at")
+    if removed_at is not None:
+        if present:
+            del delta["removed_at"]
+            gc_stats["restored"] += 1
+            save_configs(guild_id_str)
+        elif removed_at < expire_before:
+            return True
+    elif present is False:
+        # 봇이 꺼져 있는 동안 나간 서버
+        delta["removed_at"] = now
+        gc_stats["tombstoned"] += 1
+        save_configs(guild_id_str)
+    
+    if delta.get("setup_complete"):
+        if delta.pop("incomplete_since", None) is not None:
+            save_configs(guild_id_str)
+    else:
+        incomplete_since = delta.get("incomplete_since")
+        if incomplete_since is None:
+            delta["incomplete_since"] = now
+            save_configs(guild_id_str)
+        elif incomplete_since < expire_before:
+            return True
+    return False
+
+
+def _purge_guild_config(guild_id_str: str):
+    server_configs.pop(guild_id_str, None)
+    _compiled_configs.pop(guild_id_str, None)
+    save_configs(guild_id_str)
+    gc_stats["purged"] += 1
+
+
+async def sweep_configs():
+    # 조금씩 나눠서 확인하고 사이사이 이벤트 루프에 양보해서 다른 처리를 막지 않음
+    now = time.time()
+    ready = bot.is_ready()
+    purged_before = gc_stats["purged"]
+    
+    def presence(guild_id_str: str):
+        # 아직 준비되지 않았으면 서버 목록을 믿을 수 없으므로 판단하지 않음
+        if not ready:
+            return None
+        return bot.get_guild(int(guild_id_str)) is not None
+    
+    guild_ids = list(server_configs)
+    for i in range(0, len(guild_ids), CONFIG_GC_BATCH):
+        for guild_id_str in guild_ids[i:i + CONFIG_GC_BATCH]:
+            delta = server_configs.get(guild_id_str)
+            # 클러스터 모드에서는 맡은 샤드의 서버만 정리 (다른 프로세스의 서버는 건드리지 않음)
+            if not delta or guild_id_str in _dirty_guilds or not _owns_guild(int(guild_id_str)):
+                continue
+            gc_stats["scanned"] += 1
+            if _sweep_entry(guild_id_str, delta, now, presence(guild_id_str)):
+                _purge_guild_config(guild_id_str)
+        await asyncio.sleep(0)
+    
+    # sqlite는 메모리에 불러오지 않은 서버도 저장소에서 나눠 읽어서 확인
+    backend = _get_backend()
+    if not backend.full_snapshot:
+        after = 0
+        while True:
+            async with _flush_lock:
+                rows = await asyncio.to_thread(backend.scan, after, CONFIG_GC_BATCH)
+            if not rows:
+                break
+            after = int(rows[-1][0])
+            for guild_id_str, stored in rows:
+                if guild_id_str in server_configs or guild_id_str in _dirty_guilds or not _owns_guild(int(guild_id_str)):
+                    continue
+                gc_stats["scanned"] += 1
+                delta = compact_config(stored)
+                if _sweep_entry(guild_id_str, delta, now, presence(guild_id_str)):
+                    _purge_guild_config(guild_id_str)
+                elif guild_id_str in _dirty_guilds:
+                    # 바뀐 서버만 메모리에 올려서 저장
+                    server_configs[guild_id_str] = delta
+            await asyncio.sleep(0)
+    
+    reclaimed = gc_stats["purged"] - purged_before
+    gc_stats["runs"] += 1
+    gc_stats["last_run"] = datetime.now()
+    print(f'설정 정리 작업: 서버 설정 {reclaimed}개 삭제 (누적 {gc_stats["purged"]}개)')
+    return reclaimed
+
+
+async def run_config_gc(interval: float):
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await sweep_configs()
+        except Exception as e:
+            print(f'설정 정리 작업 중 오류 발생: {e}')
+
+
+# 세팅 화면(View/Modal)은 이 시간(초) 동안 사용이 없으면 정리됨
+SETUP_VIEW_TIMEOUT = 600
+# 동시에 열려 있을 수 있는 세팅 화면 수 (넘으면 가장 오래된 것부터 정리)
+SETUP_VIEW_MAX = 500
+
+
+class SetupViewRegistry:
+    
+    # (서버 ID, 사용자 ID)마다 열려 있는 세팅 화면을 하나만 유지
+    def __init__(self, max_views: int):
+        self.max_views = max_views
+        self.evicted = 0
+        self.timed_out = 0
+        self._views = OrderedDict()
+    
+    def register(self, key: tuple, view: discord.ui.View):
+        old = self._views.pop(key, None)
+        if old is not None and old is not view:
+            old.stop()
+            self.evicted += 1
+        self._views[key] = view
+        
+        while len(self._views) > self.max_views:
+            _, oldest = self._views.popitem(last=False)
+            oldest.stop()
+            self.evicted += 1
+    
+    def discard(self, key: tuple, view: discord.ui.View):
+        if self._views.get(key) is view:
+            del self._views[key]
+    
+    def __len__(self):
+        return len(self._views)
+
+
+setup_view_registry = SetupViewRegistry(SETUP_VIEW_MAX)
+
+
+class SetupWizardView(discord.ui.View):
+    
+    def __init__(self, guild_id: int, user_id: int):
+        super().__init__(timeout=SETUP_VIEW_TIMEOUT)
+        self.guild_id = guild_id
+        self.user_id = user_id
+        setup_view_registry.register((guild_id, user_id), self)
+    
+    async def on_timeout(self):
+        setup_view_registry.timed_out += 1
+        setup_view_registry.discard((self.guild_id, self.user_id), self)
+    
+    def finish(self):
+        self.stop()
+        setup_view_registry.discard((self.guild_id, self.user_id), self)
+
+
+class EmbedSettingModal(discord.ui.Modal, title="임베드 세팅"):
+    
+    embed_title = discord.ui.TextInput(
+        label="임베드 제목",
+        placeholder="인증 시스템",
+        default="이것은 제목(Title)입니다.",
+        max_length=256,
+        required=True
+    )
+    
+    embed_description = discord.ui.TextInput(
+        label="임베드 내용",
+        placeholder="버튼을 눌러 인증하세요",
+        style=discord.TextStyle.paragraph,
+        default="이것은 내용입니다. 밑 세팅하기 눌러서 헥스코드(#제외)와 제목과 내용을 입력해주세요",
+        max_length=4000,
+        required=True
+    )
+    
+    embed_color = discord.ui.TextInput(
+        label="임베드 색상 (헥스코드, # 제외)",
+        placeholder="00FF00",
+        default="00FF00",
+        min_length=6,
+        max_length=6,
+        required=True
+    )
+    
+    def __init__(self, guild_id: int):
+        super().__init__(timeout=SETUP_VIEW_TIMEOUT)
+        self.guild_id = guild_id
+    
+    async def on_submit(self, interaction: discord.Interaction):
+        update_server_config(
+            self.guild_id,
+            embed_title=self.embed_title.value,
+            embed_description=self.embed_description.value,
+            embed_color=self.embed_color.value
+        )
+        
+        view = SetupStep1View(self.guild_id, interaction.user.id)
+        
+        await interaction.response.edit_message(embed=get_compiled_config(self.guild_id).embed, view=view)
+
+
+class ButtonSettingModal(discord.ui.Modal, title="버튼 세팅"):
+    
+    button_label = discord.ui.TextInput(
+        label="버튼 텍스트",
+        placeholder="인증하기",
+        default="인증하기",
+        max_length=80,
+        required=True
+    )
+    
+    button_emoji = discord.ui.TextInput(
+        label="버튼 이모지 (선택사항)",
+        placeholder="🔐",
+        default="🔐",
+        max_length=2,
+        required=False
+    )
+    
+    def __init__(self, guild_id: int):
+        super().__init__(timeout=SETUP_VIEW_TIMEOUT)
+        self.guild_id = guild_id
+    
+    async def on_submit(self, interaction: discord.Interaction):
+        update_server_config(
+            self.guild_id,
+            button_label=self.button_label.value,
+            button_emoji=self.button_emoji.value if self.button_emoji.value else None
+        )
+        
+        view = SetupStep1View(self.guild_id, interaction.user.id)
+        
+        await interaction.response.edit_message(embed=get_compiled_config(self.guild_id).embed, view=view)
+
+
+class LogChannelModal(discord.ui.Modal, title="로그 채널 설정"):
+    
+    channel_id = discord.ui.TextInput(
+        label="채널 ID",
+        placeholder="1234567890123456789",
+        min_length=17,
+        max_length=20,
+        required=True
+    )
+    
+    def __init__(self, guild_id: int):
+        super().__init__(timeout=SETUP_VIEW_TIMEOUT)
+        self.guild_id = guild_id
+    
+    async def on_submit(self, interaction: discord.Interaction):
+        try:
+            channel_id = int(self.channel_id.value)
+            channel = interaction.guild.get_channel(channel_id)
+            
+            if not channel:
+                await interaction.response.send_message(
+                    "❌ 해당 ID의 채널을 찾을 수 없습니다. 올바른 채널 ID를 입력해주세요.",
+                    ephemeral=True
+                )
+                return
+            
+            if not isinstance(channel, discord.TextChannel):
+                await interaction.response.send_message(
+                    "❌ 텍스트 채널 ID를 입력해주세요.",
+                    ephemeral=True
+                )
+                return
+            
+            update_server_config(self.guild_id, log_channel_id=channel_id)
+            
+            await interaction.response.send_message(
+                f"✅ 로그 채널이 {channel.mention}(으)로 설정되었습니다!",
+                ephemeral=True
+            )
+        except ValueError:
+            await interaction.response.send_message(
+                "❌ 올바른 채널 ID를 입력해주세요.",
+                ephemeral=True
+            )
+
+
+class AdmissionLimitModal(discord.ui.Modal, title="인증 속도 제한"):
+    
+    rate = discord.ui.TextInput(
+        label="분당 처리할 인증 수",
+        placeholder="60",
+        min_length=1,
+        max_length=4,
+        required=True
+    )
+    
+    burst = discord.ui.TextInput(
+        label="한꺼번에 몰려도 바로 받을 인증 수",
+        placeholder="20",
+        min_length=1,
+        max_length=4,
+        required=True
+    )
+    
+    def __init__(self, guild_id: int):
+        super().__init__(timeout=SETUP_VIEW_TIMEOUT)
+        self.guild_id = guild_id
+        config = get_compiled_config(guild_id)
+        self.rate.default = str(config.admission_rate)
+        self.burst.default = str(config.admission_burst)
+    
+    async def on_submit(self, interaction: discord.Interaction):
+        try:
+            rate = int(self.rate.value)
+            burst = int(self.burst.value)
+        except ValueError:
+            await interaction.response.send_message(
+                "❌ 숫자만 입력해주세요.",
+                ephemeral=True
+            )
+            return
+        
+        if not (1 <= rate <= ADMISSION_MAX_RATE and 1 <= burst <= ADMISSION_MAX_RATE):
+            await interaction.response.send_message(
+                f"❌ 1부터 {ADMISSION_MAX_RATE} 사이의 숫자를 입력해주세요.",
+                ephemeral=True
+            )
+            return
+        
+        update_server_config(self.guild_id, admission_rate=rate, admission_burst=burst)
+        
+        await interaction.response.send_message(
+            f"✅ 인증 속도 제한이 분당 {rate}회, 한꺼번에 {burst}회로 설정되었습니다!",
+            ephemeral=True
+        )
+
+
+class SetupStartView(SetupWizardView):
+    
+    def __init__(self, guild_id: int, user_id: int):
+        super().__init__(guild_id, user_id)
+    
+    @discord.ui.button(label="시작하기", style=discord.ButtonStyle.green, emoji="✅")
+    async def start_button(
+        self,
+        interaction: discord.Interaction,
+        button: discord.ui.Button
+    ):
+        view = SetupStep1View(self.guild_id, interaction.user.id)
+        
+        await interaction.response.edit_message(embed=get_compiled_config(self.guild_id).embed, view=view)
+
+
+class SetupStep1View(SetupWizardView):
+    
+    def __init__(self, guild_id: int, user_id: int):
+        super().__init__(guild_id, user_id)
+        
+        config = get_compiled_config(guild_id)
+        
+        preview_button = discord.ui.Button(
+            label=config.button_label,
+            style=discord.ButtonStyle.primary,
+            emoji=config.button_emoji,
+            disabled=True,
+            row=0
+        )
+        self.add_item(preview_button)
+        self.add_item(VerificationModeSelect(guild_id, config.verification_mode))
+    
+    @discord.ui.button(label="세팅하기", style=discord.ButtonStyle.secondary, row=1)
+    async def embed_setting_button(
+        self,
+        interaction: discord.Interaction,
+        button: discord.ui.Button
+    ):
+        modal = EmbedSettingModal(self.guild_id)
+        await interaction.response.send_modal(modal)
+    
+    @discord.ui.button(label="버튼 세팅하기", style=discord.ButtonStyle.secondary, row=1)
+    async def button_setting_button(
+        self,
+        interaction: discord.Interaction,
+        button: discord.ui.Button
+    ):
+        modal = ButtonSettingModal(self.guild_id)
+        await interaction.response.send_modal(modal)
+    
+    @discord.ui.button(label="속도 제한", style=discord.ButtonStyle.secondary, row=1)
+    async def admission_setting_button(
+        self,
+        interaction: discord.Interaction,
+        button: discord.ui.Button
+    ):
+        modal = AdmissionLimitModal(self.guild_id)
+        await interaction.response.send_modal(modal)
+    
+    @discord.ui.button(label="다음", style=discord.ButtonStyle.green, row=1)
+    async def next_button(
+        self,
+        interaction: discord.Interaction,
+        button: discord.ui.Button
+    ):
+        view = SetupStep2View(self.guild_id, interaction.user.id)
+        
+        embed = discord.Embed(
+            title="역할 선택",
+            description=(
+                "완벽해요 ! 클릭시 지급할 역할을 선택해주세요\n"
+                "(봇 역할이 지급될 역할보다 낮다면 지급이 불가능해요 !)"
+            ),
+            color=discord.Color.blue()
+        )
+        
+        await interaction.response.edit_message(embed=embed, view=view)
+
+
+# 인증 방식: fast = 누르면 바로 지급, challenge = 계산 문제를 풀어야 지급
+VERIFICATION_MODES = {
+    "fast": ("빠른 인증", "버튼을 누르면 바로 역할을 지급합니다"),
+    "challenge": ("문제 인증", "간단한 계산 문제를 맞혀야 역할을 지급합니다")
+}
+
+
+class VerificationModeSelect(discord.ui.Select):
+    
+    def __init__(self, guild_id: int, current_mode: str):
+        self.guild_id = guild_id
+        
+        options = [
+            discord.SelectOption(
+                label=label,
+                value=mode,
+                description=description,
+                default=mode == current_mode
+            )
+            for mode, (label, description) in VERIFICATION_MODES.items()
+        ]
         
         super().__init__(
-            placeholder="역할을 선택하세요...",
+            placeholder="인증 방식을 선택하세요...",
             min_values=1,
             max_values=1,
-            options=options
+            options=options,
+            row=2
         )
     
     async def callback(self, interaction: discord.Interaction):
-        role_id = int(self.values[0])
-        role = interaction.guild.get_role(role_id)
+        mode = self.values[0]
+        update_server_config(self.guild_id, verification_mode=mode)
         
-        if not role:
+        await interaction.response.send_message(
+            f"✅ 인증 방식이 **{VERIFICATION_MODES[mode][0]}**(으)로 설정되었습니다!",
+            ephemeral=True
+        )
+
+
+class SetupStep2View(SetupWizardView):
+    
+    def __init__(self, guild_id: int, user_id: int):
+        super().__init__(guild_id, user_id)
+        self.add_item(RoleSelectMenu(guild_id))
+    
+    @discord.ui.button(label="다음", style=discord.ButtonStyle.green)
+    async def next_button(
+        self,
+        interaction: discord.Interaction,
+        button: discord.ui.Button
+    ):
+        config = get_compiled_config(self.guild_id)
+        
+        if not config.verified_role_id:
             await interaction.response.send_message(
-                "❌ 역할을 찾을 수 없습니다.",
+                "❌ 먼저 역할을 선택해주세요!",
                 ephemeral=True
             )
             return
         
-        config = get_server_config(self.guild_id)
-        config["verified_role_id"] = role_id
-        save_configs()
+        view = SetupStep3View(self.guild_id, interaction.user.id)
         
-        await interaction.response.send_message(
-            f"✅ 인증 역할이 {role.mention}(으)로 설정되었습니다!",
-            ephemeral=True
+        embed = discord.Embed(
+            title="로그 채널 설정",
+            description="이제 마지막 !! 로그 채널을 설정해주세요",
+            color=discord.Color.blue()
         )
+        
+        await interaction.response.edit_message(embed=embed, view=view)
 
 
-class SetupStep3View(discord.ui.View):
+class RoleSelectMenu(discord.ui.RoleSelect):
     
+    # 디스코드 기본 역할 선택 메뉴: 목록과 검색을 디스코드가 처리하므로
+    # 역할이 수백 개인 서버에서도 모든 역할을 고를 수 있고 서버 역할을 매번 훑지 않음
     def __init__(self, guild_id: int):
-        super().__init__(timeout=None)
         self.guild_id = guild_id
+        
+        role_id = get_compiled_config(guild_id).verified_role_id
+        super().__init__(
+            placeholder="역할을 선택하거나 검색하세요...",
+            min_values=1,
+            max_values=1,
+            default_values=[discord.Object(id=role_id)] if role_id else []
+        )
+    
+    async def callback(self, interaction: discord.Interaction):
+        role_id = self.values[0].id
+        role = interaction.guild.get_role(role_id)
+        
+        if not role:
+            await interaction.response.send_message(
+                "❌ 역할을 찾을 수 없습니다.",
+                ephemeral=True
+            )
+            return
+        
+        # 기본 메뉴는 모든 역할을 보여주므로 지급할 수 없는 역할은 여기서 거름
+        if role.is_default() or role.managed:
+            await interaction.response.send_message(
+                "❌ @everyone이나 연동/봇 전용 역할은 인증 역할로 쓸 수 없습니다.",
+                ephemeral=True
+            )
+            return
+        
+        update_server_config(self.guild_id, verified_role_id=role_id)
+        
+        message = f"✅ 인증 역할이 {role.mention}(으)로 설정되었습니다!"
+        problem = role_assignability.check(interaction.guild, role_id)
+        if problem is not None:
+            message += f"\n⚠️ 하지만 지금은 이 역할을 지급할 수 없습니다: {ROLE_PROBLEMS[problem]}"
+        
+        await interaction.response.send_message(message, ephemeral=True)
+
+
+class SetupStep3View(SetupWizardView):
+    
+    def __init__(self, guild_id: int, user_id: int):
+        super().__init__(guild_id, user_id)
     
     @discord.ui.button(label="로그채널 지정 안하기", style=discord.ButtonStyle.secondary)
     async def no_log_button(
@@ -382,10 +1559,7 @@ class SetupStep3View(discord.ui.View):
         interaction: discord.Interaction,
         button: discord.ui.Button
     ):
-        config = get_server_config(self.guild_id)
-        config["log_channel_id"] = None
-        config["setup_complete"] = True
-        save_configs()
+        update_server_config(self.guild_id, log_channel_id=None, setup_complete=True)
         
         embed = discord.Embed(
             title="✅ 세팅 완료!",
@@ -399,6 +1573,7 @@ class SetupStep3View(discord.ui.View):
         )
         
         await interaction.response.edit_message(embed=embed, view=None)
+        self.finish()
     
     @discord.ui.button(label="로그채널 지정하기", style=discord.ButtonStyle.primary)
     async def set_log_button(
@@ -409,44 +1584,1008 @@ class SetupStep3View(discord.ui.View):
         modal = LogChannelModal(self.guild_id)
         await interaction.response.send_modal(modal)
         
-        await asyncio.sleep(1)
+        update_server_config(self.guild_id, setup_complete=True)
+        self.finish()
+
+
+# 역할 지급 대기열 설정 (서버별)
+ROLE_GRANT_WORKERS = 2
+ROLE_GRANT_RATE = 10
+ROLE_GRANT_WINDOW = 10.0
+ROLE_GRANT_MAX_RETRIES = 3
+
+
+def _retry_after_from_response(response, default: float):
+    headers = getattr(response, "headers", None) or {}
+    for name in ("Retry-After", "X-RateLimit-Reset-After"):
+        try:
+            return float(headers[name])
+        except (KeyError, TypeError, ValueError):
+            continue
+    return default
+
+
+class _GuildGrantQueue:
+    
+    __slots__ = (
+        "jobs",
+        "background",
+        "workers",
+        "next_slot",
+        "blocked_until",
+        "granted",
+        "wait_total",
+        "wait_max"
+    )
+    
+    def __init__(self):
+        self.jobs = deque()
+        # 일괄 인증처럼 기다리는 사람이 없는 작업은 클릭 처리 뒤로 밀림
+        self.background = deque()
+        self.workers = 0
+        self.next_slot = 0.0
+        self.blocked_until = 0.0
+        self.granted = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+
+class RoleGrantScheduler:
+    
+    # 서버마다 역할 지급 요청을 줄 세우고, 정해진 수의 작업자가
+    # 레이트 리밋 구간(window)에 맞춰 간격을 두고 지급함
+    def __init__(self, workers: int, rate: int, window: float, max_retries: int):
+        self.workers = workers
+        self.interval = window / rate
+        self.max_retries = max_retries
+        self.rate_limited = 0
+        self._guilds = {}
+    
+    def submit(self, member: discord.Member, role: discord.Role, background: bool = False):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        
+        state = self._guilds.get(member.guild.id)
+        if state is None:
+            state = self._guilds[member.guild.id] = _GuildGrantQueue()
+        
+        queue = state.background if background else state.jobs
+        queue.append((member, role, future, loop.time(), 0))
+        if state.workers < self.workers:
+            state.workers += 1
+            asyncio.ensure_future(self._worker(member.guild.id, state))
+        return future
+    
+    def depth(self, guild_id: int):
+        state = self._guilds.get(guild_id)
+        return len(state.jobs) if state else 0
+    
+    def estimated_wait(self, guild_id: int):
+        state = self._guilds.get(guild_id)
+        if state is None:
+            return 0.0
+        now = asyncio.get_running_loop().time()
+        start = max(now, state.next_slot, state.blocked_until)
+        return start - now + len(state.jobs) * self.interval
+    
+    def stats(self, guild_id: int):
+        state = self._guilds.get(guild_id)
+        if state is None:
+            return {"depth": 0, "background": 0, "workers": 0, "granted": 0, "avg_wait": 0.0, "max_wait": 0.0, "oldest_wait": 0.0}
+        now = asyncio.get_running_loop().time()
+        done = state.granted or 1
+        return {
+            "depth": len(state.jobs),
+            "background": len(state.background),
+            "workers": state.workers,
+            "granted": state.granted,
+            "avg_wait": state.wait_total / done,
+            "max_wait": state.wait_max,
+            "oldest_wait": now - state.jobs[0][3] if state.jobs else 0.0
+        }
+    
+    def guild_ids(self):
+        return list(self._guilds)
+    
+    async def _worker(self, guild_id: int, state: _GuildGrantQueue):
+        loop = asyncio.get_running_loop()
+        try:
+            while state.jobs or state.background:
+                queue = state.jobs if state.jobs else state.background
+                job = queue.popleft()
+                if job[2].done():
+                    continue
+                
+                # 다음 지급 가능 시각을 예약해서 구간 전체에 고르게 분산
+                now = loop.time()
+                start = max(now, state.next_slot, state.blocked_until)
+                state.next_slot = start + self.interval
+                if start > now:
+                    await asyncio.sleep(start - now)
+                
+                if queue is state.jobs:
+                    metrics.observe("verified_verify_stage_seconds", loop.time() - job[3], stage="queue_wait")
+                await self._grant(state, job, queue)
+        finally:
+            state.workers -= 1
+            if not state.workers and not state.jobs and not state.background:
+                self._guilds.pop(guild_id, None)
+    
+    async def _grant(self, state: _GuildGrantQueue, job, queue: deque):
+        member, role, future, enqueued_at, attempts = job
+        loop = asyncio.get_running_loop()
+        
+        try:
+            with metrics.timer("verified_verify_stage_seconds", stage="add_roles"):
+                await member.add_roles(role)
+        except discord.RateLimited as e:
+            retry_after = e.retry_after
+        except discord.HTTPException as e:
+            if e.status != 429:
+                if not future.done():
+                    future.set_exception(e)
+                return
+            retry_after = _retry_after_from_response(e.response, self.interval)
+        except Exception as e:
+            if not future.done():
+                future.set_exception(e)
+            return
+        else:
+            waited = loop.time() - enqueued_at
+            state.granted += 1
+            if queue is state.jobs:
+                state.wait_total += waited
+                state.wait_max = max(state.wait_max, waited)
+            if not future.done():
+                future.set_result(waited)
+            return
+        
+        # 429: 헤더에 나온 시간만큼 이 서버의 지급을 멈추고 다시 시도
+        self.rate_limited += 1
+        metrics.inc("verified_rest_429_total", source="role_grant")
+        state.blocked_until = max(state.blocked_until, loop.time() + retry_after)
+        if attempts < self.max_retries:
+            queue.appendleft((member, role, future, enqueued_at, attempts + 1))
+        elif not future.done():
+            future.set_exception(discord.RateLimited(retry_after))
+
+
+role_grant_scheduler = RoleGrantScheduler(
+    ROLE_GRANT_WORKERS,
+    ROLE_GRANT_RATE,
+    ROLE_GRANT_WINDOW,
+    ROLE_GRANT_MAX_RETRIES
+)
+
+
+# 인증 로그는 채널별로 모아서 한 메시지(최대 10개 임베드)로 전송
+LOG_BATCH_SIZE = 10
+LOG_FLUSH_INTERVAL = 2.0
+
+
+class VerificationLogWriter:
+    
+    def __init__(self, batch_size: int, interval: float):
+        self.batch_size = batch_size
+        self.interval = interval
+        self.sent_messages = 0
+        self.sent_embeds = 0
+        self._buffers = {}
+        self._channels = {}
+        self._timers = {}
+        self._tasks = set()
+    
+    def add(self, channel: discord.TextChannel, embed: discord.Embed):
+        buffer = self._buffers.setdefault(channel.id, [])
+        self._channels[channel.id] = channel
+        buffer.append(embed)
+        
+        if len(buffer) >= self.batch_size:
+            self._flush(channel.id)
+        elif channel.id not in self._timers:
+            loop = asyncio.get_running_loop()
+            self._timers[channel.id] = loop.call_later(self.interval, self._flush, channel.id)
+    
+    def pending(self):
+        return sum(len(buffer) for buffer in self._buffers.values())
+    
+    def _flush(self, channel_id: int):
+        timer = self._timers.pop(channel_id, None)
+        if timer is not None:
+            timer.cancel()
+        
+        embeds = self._buffers.pop(channel_id, None)
+        channel = self._channels.pop(channel_id, None)
+        if not embeds or channel is None:
+            return
+        
+        task = asyncio.ensure_future(self._send(channel, embeds))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+    
+    async def _send(self, channel: discord.TextChannel, embeds: list):
+        try:
+            with metrics.timer("verified_verify_stage_seconds", stage="log_send"):
+                await channel.send(embeds=embeds)
+        except discord.HTTPException as e:
+            metrics.inc("verified_log_send_errors_total")
+            if e.status == 429:
+                metrics.inc("verified_rest_429_total", source="log_send")
+            print(f'인증 로그 전송 중 오류 발생: {e}')
+            return
+        self.sent_messages += 1
+        self.sent_embeds += len(embeds)
+    
+    async def flush_all(self):
+        for channel_id in list(self._buffers):
+            self._flush(channel_id)
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+
+verification_log_writer = VerificationLogWriter(LOG_BATCH_SIZE, LOG_FLUSH_INTERVAL)
+
+
+# 인증 기록 (추가만 하는 JSON Lines 파일, 일정 크기가 넘으면 압축 보관)
+AUDIT_DIR = "verification_audit"
+AUDIT_ROTATE_BYTES = 16 * 1024 * 1024
+AUDIT_FLUSH_INTERVAL = 1.0
+# 서버별 카운터 스냅샷 저장 간격(초) - 그 이후 기록은 시작할 때 이벤트 파일에서 다시 반영
+AUDIT_COUNTER_SAVE_INTERVAL = 60.0
+# 서버별로 유지하는 시간 단위 집계 수
+AUDIT_HOUR_BUCKETS = 48
+
+# 실패로 집계하는 결과
+FAILED_OUTCOMES = {"forbidden", "error", "role_missing", "not_configured", "misconfigured"}
+
+
+class VerificationAuditStore:
+    
+    def __init__(self, directory: str, rotate_bytes: int, flush_interval: float, counter_interval: float):
+        self.directory = directory
+        self.events_path = os.path.join(directory, "events.jsonl")
+        self.counters_path = os.path.join(directory, "counters.json")
+        self.rotate_bytes = rotate_bytes
+        self.flush_interval = flush_interval
+        self.counter_interval = counter_interval
+        self.recorded = 0
+        self.rotations = 0
+        self._counters = {}
+        self._pending = []
+        self._events_size = 0
+        self._last_counter_save = 0.0
+        self._flush_handle = None
+        self._lock = asyncio.Lock()
+    
+    def load(self):
+        os.makedirs(self.directory, exist_ok=True)
+        
+        offset = 0
+        if os.path.exists(self.counters_path):
+            with open(self.counters_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            self._counters = data["guilds"]
+            offset = data["events_offset"]
+        
+        if os.path.exists(self.events_path):
+            self._events_size = os.path.getsize(self.events_path)
+            # 카운터 저장 후 교체되기 전에 종료된 경우 새 파일 처음부터 반영
+            if offset > self._events_size:
+                offset = 0
+            with open(self.events_path, 'rb') as f:
+                f.seek(offset)
+                for line in f:
+                    try:
+                        self._count(json.loads(line))
+                    except ValueError:
+                        continue
+    
+    def record(self, guild_id: int, user_id: int, role_id: int, outcome: str, latency: float = None):
+        event = {
+            "ts": time.time(),
+            "guild": guild_id,
+            "user": user_id,
+            "role": role_id,
+            "outcome": outcome,
+            "latency_ms": round(latency * 1000, 1) if latency is not None else None
+        }
+        self._count(event)
+        self._pending.append(event)
+        self.recorded += 1
+        
+        if self._flush_handle is None:
+            loop = asyncio.get_running_loop()
+            self._flush_handle = loop.call_later(self.flush_interval, self._start_flush)
+    
+    def _count(self, event: dict):
+        counters = self._counters.get(str(event["guild"]))
+        if counters is None:
+            counters = self._counters[str(event["guild"])] = {
+                "outcomes": {},
+                "hours": {},
+                "latency_ms_total": 0.0,
+                "latency_count": 0
+            }
+        
+        outcome = event["outcome"]
+        counters["outcomes"][outcome] = counters["outcomes"].get(outcome, 0) + 1
+        if event.get("latency_ms") is not None:
+            counters["latency_ms_total"] += event["latency_ms"]
+            counters["latency_count"] += 1
+        
+        hours = counters["hours"]
+        hour = str(int(event["ts"] // 3600))
+        bucket = hours.get(hour)
+        if bucket is None:
+            bucket = hours[hour] = {"success": 0, "failed": 0}
+            if len(hours) > AUDIT_HOUR_BUCKETS:
+                del hours[min(hours, key=int)]
+        if outcome == "success":
+            bucket["success"] += 1
+        elif outcome in FAILED_OUTCOMES:
+            bucket["failed"] += 1
+    
+    def stats(self, guild_id: int):
+        counters = self._counters.get(str(guild_id))
+        if counters is None:
+            return None
+        
+        outcomes = counters["outcomes"]
+        success = outcomes.get("success", 0)
+        failed = sum(outcomes.get(outcome, 0) for outcome in FAILED_OUTCOMES)
+        
+        current_hour = int(time.time() // 3600)
+        last_24h = [counters["hours"].get(str(hour)) for hour in range(current_hour - 23, current_hour + 1)]
+        success_24h = sum(bucket["success"] for bucket in last_24h if bucket)
+        failed_24h = sum(bucket["failed"] for bucket in last_24h if bucket)
+        this_hour = counters["hours"].get(str(current_hour)) or {"success": 0, "failed": 0}
+        
+        return {
+            "total": sum(outcomes.values()),
+            "success": success,
+            "failed": failed,
+            "failure_rate": failed / (success + failed) if success + failed else 0.0,
+            "outcomes": dict(outcomes),
+            "success_24h": success_24h,
+            "per_hour_24h": success_24h / 24,
+            "failure_rate_24h": failed_24h / (success_24h + failed_24h) if success_24h + failed_24h else 0.0,
+            "this_hour": this_hour["success"],
+            "avg_latency_ms": counters["latency_ms_total"] / counters["latency_count"] if counters["latency_count"] else None
+        }
+    
+    def _start_flush(self):
+        self._flush_handle = None
+        asyncio.ensure_future(self.flush())
+    
+    async def flush(self, save_counters: bool = False):
+        async with self._lock:
+            events = self._pending
+            self._pending = []
+            
+            now = time.monotonic()
+            rotate = self._events_size >= self.rotate_bytes
+            counters_data = None
+            if save_counters or rotate or now - self._last_counter_save >= self.counter_interval:
+                # 이벤트와 맞는 시점의 카운터를 이벤트 루프에서 직렬화
+                counters_data = json.dumps(self._counters, ensure_ascii=False)
+                self._last_counter_save = now
+            
+            if not events and counters_data is None:
+                return
+            
+            try:
+                self._events_size = await asyncio.to_thread(self._write, events, counters_data, rotate)
+            except Exception as e:
+                print(f'인증 기록 저장 중 오류 발생: {e}')
+                self._pending = events + self._pending
+                return
+            if rotate:
+                self.rotations += 1
+    
+    def _write(self, events: list, counters_data: str, rotate: bool):
+        with open(self.events_path, 'a', encoding='utf-8') as f:
+            for event in events:
+                f.write(json.dumps(event, ensure_ascii=False) + "\n")
+            size = f.tell()
         
-        config = get_server_config(self.guild_id)
-        config["setup_complete"] = True
-        save_configs()
+        archive = None
+        if rotate:
+            archive = os.path.join(self.directory, f"events-{datetime.now():%Y%m%d-%H%M%S-%f}.jsonl")
+            os.replace(self.events_path, archive)
+            size = 0
+        
+        if counters_data is not None:
+            tmp_path = f"{self.counters_path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(f'{{"events_offset": {size}, "guilds": {counters_data}}}')
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.counters_path)
+        
+        if archive is not None:
+            import gzip
+            import shutil
+            
+            with open(archive, 'rb') as src, gzip.open(f"{archive}.gz", 'wb') as dst:
+                shutil.copyfileobj(src, dst)
+            os.remove(archive)
+        return size
+
+
+verification_audit = VerificationAuditStore(
+    # 서버는 한 프로세스에서만 처리되므로 클러스터마다 따로 기록해도 서버별 통계는 그대로
+    AUDIT_DIR if CLUSTER_ID is None else os.path.join(AUDIT_DIR, f"cluster-{CLUSTER_ID}"),
+    AUDIT_ROTATE_BYTES,
+    AUDIT_FLUSH_INTERVAL,
+    AUDIT_COUNTER_SAVE_INTERVAL
+)
+
+
+def record_verification(interaction: discord.Interaction, role_id: int, outcome: str):
+    metrics.inc("verified_verifications_total", outcome=outcome)
+    
+    started = interaction.extras.get("verify_started")
+    latency = time.perf_counter() - started if started is not None else None
+    verification_audit.record(interaction.guild_id, interaction.user.id, role_id, outcome, latency)
+
+
+class VerifyButton(discord.ui.DynamicItem[discord.ui.Button], template=r"verify_(?P<guild_id>[0-9]+)"):
+    
+    # 모든 서버의 인증 버튼을 이 클래스 하나로 처리 (재시작 후에도 동작)
+    def __init__(self, guild_id: int, label: str = None, emoji: str = None):
+        super().__init__(
+            discord.ui.Button(
+                label=label,
+                style=discord.ButtonStyle.success,
+                emoji=emoji,
+                custom_id=f"verify_{guild_id}"
+            )
+        )
+        self.guild_id = guild_id
+    
+    @classmethod
+    async def from_custom_id(
+        cls,
+        interaction: discord.Interaction,
+        item: discord.ui.Button,
+        match
+    ):
+        return cls(int(match["guild_id"]))
+    
+    async def callback(self, interaction: discord.Interaction):
+        interaction.extras["verify_started"] = time.perf_counter()
+        with metrics.timer("verified_verify_seconds"):
+            await verify_callback(interaction, self.guild_id)
+        record_first_interaction(interaction.extras["verify_started"])
 
 
 class VerificationView(discord.ui.View):
     
     def __init__(self, guild_id: int):
         super().__init__(timeout=None)
+        
+        config = get_compiled_config(guild_id)
+        self.add_item(VerifyButton(guild_id, config.button_label, config.button_emoji))
+
+
+# 최근 인증된 사용자는 이 시간(초) 동안 REST 호출 없이 바로 응답
+VERIFIED_CACHE_TTL = 600
+VERIFIED_CACHE_MAX = 100000
+
+
+class RecentlyVerifiedCache:
+    
+    # (서버 ID, 사용자 ID) -> (지급한 역할 ID, 만료 시각)
+    def __init__(self, ttl: float, max_size: int):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.hits = 0
+        self._entries = OrderedDict()
+    
+    def add(self, key: tuple, role_id: int):
+        self._entries.pop(key, None)
+        self._entries[key] = (role_id, time.monotonic() + self.ttl)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+    
+    def contains(self, key: tuple, role_id: int):
+        entry = self._entries.get(key)
+        if entry is None:
+            return False
+        if entry[1] < time.monotonic():
+            del self._entries[key]
+            return False
+        # 인증 역할이 바뀌었으면 다시 확인
+        if entry[0] != role_id:
+            return False
+        self.hits += 1
+        return True
+    
+    def __len__(self):
+        return len(self._entries)
+
+
+recently_verified = RecentlyVerifiedCache(VERIFIED_CACHE_TTL, VERIFIED_CACHE_MAX)
+
+# 역할 지급이 진행 중인 (서버 ID, 사용자 ID) - 연타한 클릭은 여기서 걸러짐
+_inflight_verifications = set()
+inflight_stats = {
+    "collapsed": 0
+}
+
+
+# 인증 버튼 입장 제한 (토큰 버킷): 서버별 기본값은 /세팅변경에서 서버마다 바꿀 수 있음
+ADMISSION_DEFAULT_RATE = 60
+ADMISSION_DEFAULT_BURST = 20
+# 세팅 화면에서 입력할 수 있는 최대값
+ADMISSION_MAX_RATE = 1000
+# 봇 전체 제한 (분당 / 한꺼번에)
+ADMISSION_GLOBAL_RATE = 1200
+ADMISSION_GLOBAL_BURST = 300
+# 동시에 역할 지급을 기다릴 수 있는 인증 수 (넘으면 바로 다시 시도 안내)
+ADMISSION_MAX_CONCURRENT = 200
+# 토큰 버킷을 기억해 둘 서버 수
+ADMISSION_MAX_GUILDS = 10000
+
+
+class TokenBucket:
+    
+    __slots__ = ("per_minute", "rate", "burst", "tokens", "updated")
+    
+    # per_minute는 분당 토큰 수, burst는 최대로 쌓이는 토큰 수
+    def __init__(self, per_minute: int, burst: int):
+        self.per_minute = per_minute
+        self.rate = per_minute / 60
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+    
+    def wait_time(self, now: float):
+        # 토큰 하나를 쓸 수 있을 때까지 남은 시간 (0이면 바로 가능)
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+    
+    def take(self):
+        self.tokens -= 1
+
+
+class AdmissionController:
+    
+    # 서버별 버킷과 전체 버킷을 모두 통과해야 인증을 진행하고,
+    # 역할 지급을 기다리는 인증 수는 세마포어로 제한
+    def __init__(self, global_rate: int, global_burst: int, max_concurrent: int, max_guilds: int):
+        self.global_bucket = TokenBucket(global_rate, global_burst)
+        self.max_concurrent = max_concurrent
+        self.max_guilds = max_guilds
+        self.semaphore = asyncio.Semaphore(max_concurrent)
+        self.admitted = 0
+        self.active = 0
+        self.rejected = {"guild": 0, "global": 0, "busy": 0}
+        self._buckets = OrderedDict()
+    
+    def _guild_bucket(self, config: CompiledConfig):
+        bucket = self._buckets.get(config.guild_id)
+        if bucket is None or (bucket.per_minute, bucket.burst) != (config.admission_rate, config.admission_burst):
+            bucket = TokenBucket(config.admission_rate, config.admission_burst)
+            self._buckets[config.guild_id] = bucket
+        self._buckets.move_to_end(config.guild_id)
+        while len(self._buckets) > self.max_guilds:
+            self._buckets.popitem(last=False)
+        return bucket
+    
+    def reject(self, reason: str, retry_after: float):
+        self.rejected[reason] += 1
+        metrics.inc("verified_admission_rejected_total", reason=reason)
+        return max(retry_after, 1.0)
+    
+    def admit(self, config: CompiledConfig):
+        # 통과하면 0, 아니면 다시 시도할 때까지의 시간(초)
+        now = time.monotonic()
+        bucket = self._guild_bucket(config)
+        
+        wait = bucket.wait_time(now)
+        if wait:
+            return self.reject("guild", wait)
+        wait = self.global_bucket.wait_time(now)
+        if wait:
+            return self.reject("global", wait)
+        if self.semaphore.locked():
+            return self.reject("busy", 1.0)
+        
+        bucket.take()
+        self.global_bucket.take()
+        self.admitted += 1
+        return 0.0
+    
+    @contextlib.asynccontextmanager
+    async def slot(self):
+        async with self.semaphore:
+            self.active += 1
+            try:
+                yield
+            finally:
+                self.active -= 1
+
+
+admission = AdmissionController(
+    ADMISSION_GLOBAL_RATE,
+    ADMISSION_GLOBAL_BURST,
+    ADMISSION_MAX_CONCURRENT,
+    ADMISSION_MAX_GUILDS
+)
+
+
+async def send_throttled(interaction: discord.Interaction, role_id: int, retry_after: float):
+    record_verification(interaction, role_id, "throttled")
+    await interaction.response.send_message(
+        f"⏳ 지금 인증 요청이 많습니다. {math.ceil(retry_after)}초 후에 다시 시도해주세요.",
+        ephemeral=True
+    )
+
+
+# 인증 역할을 지급할 수 없는 이유
+ROLE_PROBLEMS = {
+    "role_missing": "인증 역할이 삭제되었습니다.",
+    "managed": "연동/봇 전용 역할이나 @everyone은 지급할 수 없습니다.",
+    "no_manage_roles": "봇에 '역할 관리' 권한이 없습니다.",
+    "hierarchy": "봇의 가장 높은 역할이 인증 역할보다 아래에 있습니다.",
+    "forbidden": "디스코드가 역할 지급을 거부했습니다. 봇 권한과 역할 순서를 확인해주세요."
+}
+# 린 모드에서는 봇 멤버 변경 이벤트를 받지 못하므로 이 시간(초)이 지나면 다시 확인
+ROLE_CHECK_TTL = 300
+
+
+class RoleAssignabilityCache:
+    
+    # 서버별로 인증 역할을 지급할 수 있는지 미리 확인해 둠 (문제가 있으면 REST 호출 없이 바로 실패)
+    # 역할/봇 멤버 변경 이벤트가 오면 지우고 다음 클릭 때 다시 계산
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self.fast_failures = 0
+        self._entries = {}
+        self._alerted = {}
+    
+    def compute(self, guild: discord.Guild, role_id: int):
+        role = guild.get_role(role_id)
+        if role is None:
+            return "role_missing"
+        if role.is_default() or role.managed:
+            return "managed"
+        
+        me = guild.me
+        if me is None:
+            return None
+        if not me.guild_permissions.manage_roles:
+            return "no_manage_roles"
+        if not role.is_assignable():
+            return "hierarchy"
+        return None
+    
+    def check(self, guild: discord.Guild, role_id: int):
+        now = time.monotonic()
+        entry = self._entries.get(guild.id)
+        if entry is not None and entry[0] == role_id and entry[2] > now:
+            return entry[1]
+        
+        problem = self.compute(guild, role_id)
+        self._entries[guild.id] = (role_id, problem, now + self.ttl)
+        if problem is None:
+            # 고쳐졌으면 다음에 또 문제가 생길 때 다시 알림
+            self._alerted.pop(guild.id, None)
+        return problem
+    
+    def mark(self, guild_id: int, role_id: int, problem: str):
+        self._entries[guild_id] = (role_id, problem, time.monotonic() + self.ttl)
+    
+    def invalidate(self, guild_id: int):
+        self._entries.pop(guild_id, None)
+    
+    def should_alert(self, guild_id: int, role_id: int, problem: str):
+        # 같은 문제는 한 번만 알림
+        if self._alerted.get(guild_id) == (role_id, problem):
+            return False
+        self._alerted[guild_id] = (role_id, problem)
+        return True
+
+
+role_assignability = RoleAssignabilityCache(ROLE_CHECK_TTL)
+
+
+async def _send_owner_alert(owner: discord.Member, embed: discord.Embed):
+    try:
+        await owner.send(embed=embed)
+    except discord.HTTPException as e:
+        print(f'서버 소유자에게 알림을 보내지 못했습니다: {e}')
+
+
+def alert_misconfiguration(guild: discord.Guild, config: CompiledConfig, problem: str):
+    if not role_assignability.should_alert(guild.id, config.verified_role_id, problem):
+        return
+    
+    print(f'인증 역할 지급 불가 (서버 {guild.id}): {ROLE_PROBLEMS[problem]}')
+    embed = discord.Embed(
+        title="⚠️ 인증 역할을 지급할 수 없습니다",
+        description=(
+            f"{ROLE_PROBLEMS[problem]}\n"
+            "고치기 전까지 인증 버튼을 누르면 바로 실패합니다. `/세팅변경`에서 역할을 다시 확인해주세요."
+        ),
+        color=discord.Color.orange(),
+        timestamp=datetime.now()
+    )
+    
+    # 로그 채널이 있으면 로그 채널로, 없으면 서버 소유자에게 DM
+    log_channel = guild.get_channel(config.log_channel_id) if config.log_channel_id else None
+    if log_channel is not None:
+        verification_log_writer.add(log_channel, embed)
+    elif guild.owner is not None:
+        asyncio.ensure_future(_send_owner_alert(guild.owner, embed))
+
+
+async def verify_callback(interaction: discord.Interaction, guild_id: int):
+    if interaction.guild_id != guild_id:
+        await interaction.response.send_message(
+            "❌ 이 서버의 인증 버튼이 아닙니다.",
+            ephemeral=True
+        )
+        return
+    
+    config = get_compiled_config(guild_id)
+    role_id = config.verified_role_id
+    key = (guild_id, interaction.user.id)
+    
+    if role_id and recently_verified.contains(key, role_id):
+        record_verification(interaction, role_id, "already_verified")
+        await interaction.response.send_message(
+            "✅ 이미 인증된 사용자입니다!",
+            ephemeral=True
+        )
+        return
+    
+    if key in _inflight_verifications:
+        inflight_stats["collapsed"] += 1
+        record_verification(interaction, role_id, "in_progress")
+        await interaction.response.send_message(
+            "⏳ 인증을 처리하고 있습니다. 잠시만 기다려주세요.",
+            ephemeral=True
+        )
+        return
+    
+    if not role_id:
+        record_verification(interaction, role_id, "not_configured")
+        await interaction.response.send_message(
+            "❌ 역할이 설정되지 않았습니다. 관리자에게 문의하세요.",
+            ephemeral=True
+        )
+        return
+    
+    role = interaction.guild.get_role(role_id)
+    if not role:
+        alert_misconfiguration(interaction.guild, config, "role_missing")
+        record_verification(interaction, role_id, "role_missing")
+        await interaction.response.send_message(
+            "❌ 역할을 찾을 수 없습니다. 관리자에게 문의하세요.",
+            ephemeral=True
+        )
+        return
+    
+    # 상호작용에 담긴 멤버의 역할 ID로 확인 (멤버 캐시 불필요)
+    if interaction.user.get_role(role_id) is not None:
+        recently_verified.add(key, role_id)
+        record_verification(interaction, role_id, "already_verified")
+        await interaction.response.send_message(
+            "✅ 이미 인증된 사용자입니다!",
+            ephemeral=True
+        )
+        return
+    
+    problem = role_assignability.check(interaction.guild, role_id)
+    if problem is not None:
+        role_assignability.fast_failures += 1
+        alert_misconfiguration(interaction.guild, config, problem)
+        record_verification(interaction, role_id, "misconfigured")
+        await interaction.response.send_message(
+            "❌ 봇이 인증 역할을 지급할 수 없는 상태입니다. 관리자에게 문의하세요.",
+            ephemeral=True
+        )
+        return
+    
+    # 문제 창을 여는 것도 입장 제한에 포함 (답을 제출할 때는 다시 세지 않음)
+    retry_after = admission.admit(config)
+    if retry_after:
+        await send_throttled(interaction, role_id, retry_after)
+        return
+    
+    if config.verification_mode == "challenge":
+        record_verification(interaction, role_id, "challenge_sent")
+        await interaction.response.send_modal(VerifyChallengeModal(guild_id))
+        return
+    
+    await grant_verified_role(interaction, config, role)
+
+
+# 상호작용이 만들어진 뒤 이 시간(초) 안에 역할 지급이 끝나면 응답 한 번으로 끝내고,
+# 넘어갈 것 같으면 defer 후 followup으로 결과를 보냄
+# (상호작용 제한 3초는 디스코드가 만든 시각부터 세므로 전달 지연을 감안해 여유를 둠)
+VERIFY_RESPONSE_BUDGET = 2.0
+
+# 응답 방식별 횟수: single = send_message 한 번, deferred = 먼저 응답 후 followup
+response_path_stats = {
+    "single": 0,
+    "deferred": 0
+}
+
+
+def _grant_result_message(interaction: discord.Interaction, future: asyncio.Future, role: discord.Role):
+    try:
+        future.result()
+    except discord.Forbidden:
+        # 원인을 모르더라도 이벤트가 오거나 만료될 때까지 다음 클릭은 바로 실패
+        role_assignability.mark(interaction.guild_id, role.id, "forbidden")
+        alert_misconfiguration(interaction.guild, get_compiled_config(interaction.guild_id), "forbidden")
+        record_verification(interaction, role.id, "forbidden")
+        return "❌ 역할 지급 권한이 없습니다. 봇의 권한을 확인해주세요.", False
+    except Exception as e:
+        record_verification(interaction, role.id, "error")
+        return f"❌ 오류가 발생했습니다: {str(e)}", False
+    record_verification(interaction, role.id, "success")
+    return f"✅ 인증 완료! {role.name} 역할이 지급되었습니다.", True
+
+
+async def grant_verified_role(
+    interaction: discord.Interaction,
+    config: CompiledConfig,
+    role: discord.Role
+):
+    guild_id = interaction.guild_id
+    key = (guild_id, interaction.user.id)
+    
+    # 계산 문제 창을 여러 개 열어 차례로 제출해도 한 번만 지급되도록 지급 직전에 다시 확인
+    if recently_verified.contains(key, role.id) or interaction.user.get_role(role.id) is not None:
+        recently_verified.add(key, role.id)
+        record_verification(interaction, role.id, "already_verified")
+        await interaction.response.send_message(
+            "✅ 이미 인증된 사용자입니다!",
+            ephemeral=True
+        )
+        return
+    
+    if key in _inflight_verifications:
+        inflight_stats["collapsed"] += 1
+        record_verification(interaction, role.id, "in_progress")
+        await interaction.response.send_message(
+            "⏳ 인증을 처리하고 있습니다. 잠시만 기다려주세요.",
+            ephemeral=True
+        )
+        return
+    
+    if admission.semaphore.locked():
+        await send_throttled(interaction, role.id, admission.reject("busy", 1.0))
+        return
+    
+    _inflight_verifications.add(key)
+    try:
+        async with admission.slot():
+            success = await _grant_and_respond(interaction, role)
+    finally:
+        _inflight_verifications.discard(key)
+    
+    if not success:
+        return
+    
+    recently_verified.add(key, role.id)
+    
+    log_channel_id = config.log_channel_id
+    if log_channel_id:
+        log_channel = interaction.guild.get_channel(log_channel_id)
+        if log_channel:
+            log_embed = discord.Embed(
+                title="✅ 인증 로그",
+                description=f"{interaction.user.mention}님이 인증을 완료했습니다.",
+                color=discord.Color.green(),
+                timestamp=datetime.now()
+            )
+            log_embed.add_field(name="사용자", value=f"{interaction.user} ({interaction.user.id})")
+            log_embed.add_field(name="역할", value=role.mention)
+            verification_log_writer.add(log_channel, log_embed)
+
+
+def _response_time_left(interaction: discord.Interaction):
+    # 봇이 받기 전까지 걸린 시간도 빼고 남은 시간 계산
+    age = (discord.utils.utcnow() - interaction.created_at).total_seconds()
+    return max(VERIFY_RESPONSE_BUDGET - max(age, 0.0), 0.0)
+
+
+def _response_failed(interaction: discord.Interaction, stage: str, error: discord.HTTPException):
+    # 응답 기한이 지나도 역할 지급 결과는 그대로 기록함
+    metrics.inc("verified_response_failures_total", stage=stage)
+    print(f'인증 응답 전송 실패 (서버 {interaction.guild_id}, {stage}): {error}')
+
+
+async def _grant_and_respond(interaction: discord.Interaction, role: discord.Role):
+    guild_id = interaction.guild_id
+    estimated_wait = role_grant_scheduler.estimated_wait(guild_id)
+    future = role_grant_scheduler.submit(interaction.user, role)
+    
+    time_left = _response_time_left(interaction)
+    if estimated_wait < time_left:
+        await asyncio.wait({future}, timeout=time_left)
+    
+    if future.done():
+        response_path_stats["single"] += 1
+        message, success = _grant_result_message(interaction, future, role)
+        try:
+            with metrics.timer("verified_verify_stage_seconds", stage="response"):
+                await interaction.response.send_message(message, ephemeral=True)
+        except discord.HTTPException as e:
+            _response_failed(interaction, "response", e)
+    else:
+        response_path_stats["deferred"] += 1
+        acknowledged = True
+        try:
+            with metrics.timer("verified_verify_stage_seconds", stage="defer"):
+                if estimated_wait >= VERIFY_RESPONSE_BUDGET:
+                    # 이미 밀려 있으면 대기 순번을 먼저 알려줌
+                    ahead = role_grant_scheduler.depth(guild_id) - 1
+                    await interaction.response.send_message(
+                        f"⏳ 인증 대기열에 등록되었습니다. (앞에 {ahead}명, 예상 대기 {estimated_wait:.0f}초)",
+                        ephemeral=True
+                    )
+                else:
+                    await interaction.response.defer(ephemeral=True, thinking=True)
+        except discord.HTTPException as e:
+            acknowledged = False
+            _response_failed(interaction, "defer", e)
+        
+        await asyncio.wait({future})
+        message, success = _grant_result_message(interaction, future, role)
+        if acknowledged:
+            try:
+                with metrics.timer("verified_verify_stage_seconds", stage="followup"):
+                    await interaction.followup.send(message, ephemeral=True)
+            except discord.HTTPException as e:
+                _response_failed(interaction, "followup", e)
+    
+    return success
+
+
+# 계산 문제 창을 열어두고 답하지 않으면 이 시간(초) 후 정리
+VERIFY_CHALLENGE_TIMEOUT = 300
+
+
+class VerifyChallengeModal(discord.ui.Modal, title="봇 검증"):
+    
+    def __init__(self, guild_id: int):
+        super().__init__(timeout=VERIFY_CHALLENGE_TIMEOUT)
         self.guild_id = guild_id
         
-        config = get_server_config(guild_id)
-        button_label = config.get("button_label", "인증하기")
-        button_emoji = config.get("button_emoji", "🔐")
+        num1 = random.randint(1, 10)
+        num2 = random.randint(1, 10)
+        self.expected = str(num1 + num2)
         
-        self.verify_button = discord.ui.Button(
-            label=button_label,
-            style=discord.ButtonStyle.success,
-            emoji=button_emoji,
-            custom_id=f"verify_{guild_id}"
+        self.answer = discord.ui.TextInput(
+            label=f"{num1} + {num2} = ?",
+            placeholder="정답을 숫자로 입력하세요",
+            max_length=3,
+            required=True
         )
-        self.verify_button.callback = self.verify_callback
-        self.add_item(self.verify_button)
+        self.add_item(self.answer)
     
-    async def verify_callback(self, interaction: discord.Interaction):
-        config = get_server_config(self.guild_id)
-        role_id = config.get("verified_role_id")
+    async def on_submit(self, interaction: discord.Interaction):
+        interaction.extras["verify_started"] = time.perf_counter()
+        config = get_compiled_config(self.guild_id)
         
-        if not role_id:
+        if self.answer.value.strip() != self.expected:
+            record_verification(interaction, config.verified_role_id, "wrong_answer")
             await interaction.response.send_message(
-                "❌ 역할이 설정되지 않았습니다. 관리자에게 문의하세요.",
+                "❌ 정답이 아닙니다. 인증 버튼을 다시 눌러주세요.",
                 ephemeral=True
             )
             return
         
-        role = interaction.guild.get_role(role_id)
+        role = interaction.guild.get_role(config.verified_role_id) if config.verified_role_id else None
         if not role:
             await interaction.response.send_message(
                 "❌ 역할을 찾을 수 없습니다. 관리자에게 문의하세요.",
@@ -454,72 +2593,642 @@ class VerificationView(discord.ui.View):
             )
             return
         
-        if role in interaction.user.roles:
-            await interaction.response.send_message(
-                "✅ 이미 인증된 사용자입니다!",
-                ephemeral=True
-            )
+        await grant_verified_role(interaction, config, role)
+
+# 일괄 인증 진행 상황을 서버별로 저장하는 폴더 (재시작 후 이어서 진행)
+BACKFILL_DIR = "backfill"
+# 한 번에 대기열에 넣는 인원 (이만큼 끝날 때마다 진행 상황 저장)
+BACKFILL_BATCH = 100
+# 멤버 목록 한 페이지 크기 (디스코드 API 최대값)
+BACKFILL_PAGE = 1000
+# 진행 메시지 수정 간격(초)
+BACKFILL_PROGRESS_INTERVAL = 5.0
+
+
+class BackfillManager:
+    
+    # 기존 멤버에게 인증 역할을 한꺼번에 지급
+    # 멤버를 페이지 단위로 받아오고, 역할 지급은 클릭 처리보다 뒤인 낮은 우선순위로 넣음
+    def __init__(self, directory: str, batch_size: int, progress_interval: float):
+        self.directory = directory
+        self.batch_size = batch_size
+        self.progress_interval = progress_interval
+        self._jobs = {}
+        self._tasks = {}
+    
+    def _path(self, guild_id: int):
+        return os.path.join(self.directory, f"{guild_id}.json")
+    
+    def load_checkpoints(self):
+        if not os.path.isdir(self.directory):
             return
+        for name in os.listdir(self.directory):
+            if not name.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(self.directory, name), 'r', encoding='utf-8') as f:
+                    job = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f'일괄 인증 진행 상황을 불러오지 못했습니다 ({name}): {e}')
+                continue
+            self._jobs[job["guild_id"]] = job
+    
+    def _write(self, path: str, data: str):
+        os.makedirs(self.directory, exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    
+    async def _checkpoint(self, job: dict):
+        data = json.dumps(job, ensure_ascii=False)
+        try:
+            await asyncio.to_thread(self._write, self._path(job["guild_id"]), data)
+        except OSError as e:
+            print(f'일괄 인증 진행 상황 저장 중 오류 발생: {e}')
+    
+    def get(self, guild_id: int):
+        return self._jobs.get(guild_id)
+    
+    def is_running(self, guild_id: int):
+        task = self._tasks.get(guild_id)
+        return task is not None and not task.done()
+    
+    def can_resume(self, guild_id: int, role_id: int, joined_before: datetime = None, no_roles_only: bool = False):
+        # 끝나지 않은 작업이 있고 역할/조건이 같을 때만 이어서 진행
+        job = self._jobs.get(guild_id)
+        return (
+            job is not None
+            and job["status"] != "done"
+            and job["role_id"] == role_id
+            and job["joined_before"] == (joined_before.isoformat() if joined_before else None)
+            and job["no_roles_only"] == no_roles_only
+        )
+    
+    def start(
+        self,
+        guild: discord.Guild,
+        role_id: int,
+        joined_before: datetime = None,
+        no_roles_only: bool = False,
+        restart: bool = False,
+        interaction: discord.Interaction = None
+    ):
+        if restart or not self.can_resume(guild.id, role_id, joined_before, no_roles_only):
+            job = self._jobs[guild.id] = {
+                "guild_id": guild.id,
+                "role_id": role_id,
+                "joined_before": joined_before.isoformat() if joined_before else None,
+                "no_roles_only": no_roles_only,
+                "after": 0,
+                "scanned": 0,
+                "granted": 0,
+                "skipped": 0,
+                "failed": 0,
+                "started_at": time.time(),
+                "status": "running"
+            }
+        else:
+            job = self._jobs[guild.id]
+            job["status"] = "running"
         
-        await interaction.response.defer(ephemeral=True)
-        
-        verification_time = random.uniform(1.0, 3.0)
-        await asyncio.sleep(verification_time)
+        self._tasks[guild.id] = asyncio.ensure_future(self._run(guild, job, interaction))
+        return job
+    
+    def resume_for(self, guilds: list):
+        resumed = 0
+        for guild in guilds:
+            job = self._jobs.get(guild.id)
+            if job is None or job["status"] != "running" or self.is_running(guild.id):
+                continue
+            self._tasks[guild.id] = asyncio.ensure_future(self._run(guild, job, None))
+            resumed += 1
+        return resumed
+    
+    def cancel_all(self):
+        for task in self._tasks.values():
+            task.cancel()
+    
+    def _matches(self, member: discord.Member, job: dict, joined_before: datetime):
+        if member.bot or member.get_role(job["role_id"]) is not None:
+            return False
+        if joined_before is not None and (member.joined_at is None or member.joined_at >= joined_before):
+            return False
+        # @everyone 외에 역할이 없는 멤버만
+        if job["no_roles_only"] and len(member.roles) > 1:
+            return False
+        return True
+    
+    async def _grant_batch(self, batch: list, role: discord.Role, job: dict):
+        futures = [role_grant_scheduler.submit(member, role, background=True) for member in batch]
+        await asyncio.wait(futures)
+        for future in futures:
+            if future.exception() is None:
+                job["granted"] += 1
+                metrics.inc("verified_backfill_grants_total", outcome="success")
+            else:
+                job["failed"] += 1
+                metrics.inc("verified_backfill_grants_total", outcome="error")
+    
+    def progress_text(self, job: dict, guild: discord.Guild):
+        # 속도는 이번 실행에서 확인한 인원으로만 계산 (멈춰 있던 시간이 섞이지 않도록)
+        elapsed = max(time.time() - job.get("run_started_at", job["started_at"]), 1.0)
+        total = guild.member_count or job["scanned"]
+        remaining = max(total - job["scanned"], 0)
+        rate = (job["scanned"] - job.get("run_scanned", 0)) / elapsed
         
-        num1 = random.randint(1, 10)
-        num2 = random.randint(1, 10)
-        answer = num1 + num2
+        if job["status"] == "done":
+            header = "✅ 일괄 인증이 완료되었습니다."
+        elif job["status"] == "failed":
+            header = "❌ 일괄 인증이 중단되었습니다."
+        else:
+            eta = f"{remaining / rate:.0f}초" if rate > 0 else "계산 중"
+            header = f"⏳ 일괄 인증 진행 중... (남은 시간 약 {eta})"
         
-        await asyncio.sleep(0.5)
+        return (
+            f"{header}\n"
+            f"확인한 멤버: {job['scanned']}/{total}명\n"
+            f"지급: {job['granted']}명, 건너뜀: {job['skipped']}명, 실패: {job['failed']}명"
+        )
+    
+    async def _report(self, interaction: discord.Interaction, job: dict, guild: discord.Guild):
+        if interaction is None:
+            return None
+        try:
+            await interaction.edit_original_response(content=self.progress_text(job, guild))
+        except discord.HTTPException:
+            # 상호작용 토큰(15분)이 만료되면 더 이상 수정하지 않음
+            return None
+        return interaction
+    
+    async def _run(self, guild: discord.Guild, job: dict, interaction: discord.Interaction):
+        joined_before = datetime.fromisoformat(job["joined_before"]) if job["joined_before"] else None
+        last_report = time.monotonic()
+        job["run_started_at"] = time.time()
+        job["run_scanned"] = job["scanned"]
         
         try:
-            await interaction.user.add_roles(role)
+            problem = role_assignability.check(guild, job["role_id"])
+            if problem is not None:
+                raise LookupError(ROLE_PROBLEMS[problem])
+            role = guild.get_role(job["role_id"])
             
-            await interaction.followup.send(
-                f"✅ 인증 완료! {role.name} 역할이 지급되었습니다.\n"
-                f"🤖 봇 검증 완료: `{num1} + {num2} = {answer}` ✓",
-                ephemeral=True
-            )
+            while True:
+                # 페이지 안의 순서는 보장되지 않으므로(discord.py가 뒤집어서 돌려줌) 한 페이지씩 받아 ID순으로 정렬
+                # 이렇게 해야 저장한 ID보다 작은 멤버는 모두 처리된 상태가 됨
+                page = [
+                    member async for member in guild.fetch_members(limit=BACKFILL_PAGE, after=discord.Object(job["after"]))
+                ]
+                page.sort(key=lambda member: member.id)
+                
+                for start in range(0, len(page), self.batch_size):
+                    chunk = page[start:start + self.batch_size]
+                    batch = []
+                    for member in chunk:
+                        if self._matches(member, job, joined_before):
+                            batch.append(member)
+                        else:
+                            job["skipped"] += 1
+                    await self._grant_batch(batch, role, job)
+                    job["scanned"] += len(chunk)
+                    job["after"] = chunk[-1].id
+                    await self._checkpoint(job)
+                    
+                    if time.monotonic() - last_report >= self.progress_interval:
+                        interaction = await self._report(interaction, job, guild)
+                        last_report = time.monotonic()
+                
+                if len(page) < BACKFILL_PAGE:
+                    break
             
-            log_channel_id = config.get("log_channel_id")
-            if log_channel_id:
-                log_channel = interaction.guild.get_channel(log_channel_id)
-                if log_channel:
-                    log_embed = discord.Embed(
-                        title="✅ 인증 로그",
-                        description=f"{interaction.user.mention}님이 인증을 완료했습니다.",
-                        color=discord.Color.green(),
-                        timestamp=datetime.now()
-                    )
-                    log_embed.add_field(name="사용자", value=f"{interaction.user} ({interaction.user.id})")
-                    log_embed.add_field(name="역할", value=role.mention)
-                    await log_channel.send(embed=log_embed)
-        
-        except discord.Forbidden:
-            await interaction.followup.send(
-                "❌ 역할 지급 권한이 없습니다. 봇의 권한을 확인해주세요.",
-                ephemeral=True
-            )
+            job["status"] = "done"
+        except asyncio.CancelledError:
+            # 종료 시에는 마지막 저장 지점(running 상태)부터 다음 시작 때 이어서 진행
+            raise
         except Exception as e:
-            await interaction.followup.send(
-                f"❌ 오류가 발생했습니다: {str(e)}",
-                ephemeral=True
-            )
+            job["status"] = "failed"
+            job["error"] = str(e)
+            print(f'일괄 인증 중 오류 발생 (서버 {guild.id}): {e}')
+        
+        await self._checkpoint(job)
+        await self._report(interaction, job, guild)
+        print(f'일괄 인증 종료 (서버 {guild.id}): ' + self.progress_text(job, guild).replace("\n", ", "))
 
 
-@bot.event
-async def on_ready():
-    print(f'{bot.user} 봇이 준비되었습니다!')
-    print(f'봇 ID: {bot.user.id}')
-    print('------')
+backfill_manager = BackfillManager(BACKFILL_DIR, BACKFILL_BATCH, BACKFILL_PROGRESS_INTERVAL)
+
+
+# 샤드별 준비 정보
+shard_ready_stats = {}
+
+# 처음 준비됐을 때의 시작 시간/메모리 (린 모드 켜고 끈 상태를 비교할 때 사용)
+startup_report = {}
+
+
+def _memory_usage_mb():
+    if resource is None:
+        return None
+    # 리눅스는 KB, macOS는 바이트 단위
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        return usage / (1024 * 1024)
+    return usage / 1024
+
+
+def record_startup_report():
+    startup_report.update({
+        "lean_mode": LEAN_MODE,
+        "ready_seconds": time.perf_counter() - PROCESS_STARTED,
+        "max_rss_mb": _memory_usage_mb(),
+        "guilds": len(bot.guilds),
+        "cached_members": sum(len(guild.members) for guild in bot.guilds)
+    })
+    
+    memory = startup_report["max_rss_mb"]
+    memory_text = f"{memory:.1f}MB" if memory is not None else "알 수 없음"
+    print(
+        f'시작 보고: 준비까지 {startup_report["ready_seconds"]:.1f}초, 최대 메모리 {memory_text}, '
+        f'서버 {startup_report["guilds"]}개, 캐시된 멤버 {startup_report["cached_members"]}명 '
+        f'(린 모드: {"켜짐" if LEAN_MODE else "꺼짐"})'
+    )
+
+
+async def prepare_shard(shard_id: int):
+    started = time.perf_counter()
+    guilds = [guild for guild in bot.guilds if guild.shard_id == shard_id]
+    guild_ids = [guild.id for guild in guilds]
+    warmed = warm_guild_configs(guild_ids)
+    # 재시작 전에 진행 중이던 일괄 인증을 이어서 진행
+    backfill_manager.resume_for(guilds)
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    
+    shard_ready_stats[shard_id] = {
+        "guilds": len(guild_ids),
+        "configs": warmed,
+        "prepare_ms": elapsed_ms,
+        "ready_at": datetime.now()
+    }
+    print(f'샤드 {shard_id} 준비 완료: 서버 {len(guild_ids)}개, 설정 {warmed}개 ({elapsed_ms:.1f}ms)')
+
+
+def shard_status():
+    guild_counts = {}
+    for guild in bot.guilds:
+        guild_counts[guild.shard_id] = guild_counts.get(guild.shard_id, 0) + 1
+    
+    if isinstance(bot, commands.AutoShardedBot):
+        latencies = dict(bot.latencies)
+    else:
+        latencies = {0: bot.latency}
+    
+    return [
+        {
+            "shard_id": shard_id,
+            "latency_ms": latency * 1000,
+            "guilds": guild_counts.get(shard_id, 0)
+        }
+        for shard_id, latency in sorted(latencies.items())
+    ]
+
+
+# 마지막으로 동기화한 명령어 목록의 해시 (바뀌었을 때만 다시 동기화)
+COMMAND_HASH_FILE = "command_tree.hash"
+
+# 시작 단계별 소요 시간 (ms)
+startup_phases = {}
+# (단계, 소요 시간 ms, 프로세스 시작부터 끝난 시각까지 초) - 기록된 순서대로
+startup_timeline = []
+
+# bot.run을 호출한 시각 (직접 실행할 때만 설정됨)
+RUN_STARTED = None
+# 사용 중인 이벤트 루프 ("asyncio" 또는 "uvloop")
+event_loop_name = "asyncio"
+
+_first_interaction_recorded = False
+
+
+def record_startup_phase(name: str, started: float, finished: float = None):
+    if finished is None:
+        finished = time.perf_counter()
+    elapsed_ms = (finished - started) * 1000
+    startup_phases[name] = elapsed_ms
+    startup_timeline.append((name, elapsed_ms, finished - PROCESS_STARTED))
+    if not PROFILE_STARTUP:
+        print(f'[시작] {name}: {elapsed_ms:.1f}ms')
+
+
+def record_first_interaction(started: float):
+    global _first_interaction_recorded
+    if _first_interaction_recorded or started is None:
+        return
+    _first_interaction_recorded = True
+    
+    record_startup_phase("첫 상호작용 처리", started)
+    startup_report["first_interaction_seconds"] = time.perf_counter() - PROCESS_STARTED
+    if PROFILE_STARTUP:
+        print_startup_profile()
+
+
+def print_startup_profile():
+    print(f'[시작 프로파일] 이벤트 루프: {event_loop_name}, JSON 코덱: {config_codec.name}, 빠른 시작: {"켜짐" if FAST_BOOT else "꺼짐"}')
+    for name, elapsed_ms, finished_at in startup_timeline:
+        print(f'  {name:<16} {elapsed_ms:>10.1f}ms   (시작 후 {finished_at:.3f}초)')
+    # 준비된 뒤 첫 상호작용까지는 사용자를 기다린 시간이 포함됨
+    print(f'  합계: 첫 상호작용 처리까지 {startup_report["first_interaction_seconds"]:.3f}초')
+
+
+def install_event_loop():
+    if not FAST_BOOT:
+        return "asyncio"
+    try:
+        import uvloop
+    except ImportError:
+        print('uvloop이 설치되어 있지 않아 기본 이벤트 루프를 사용합니다.')
+        return "asyncio"
+    asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    return "uvloop"
+
+
+def command_tree_hash():
+    payload = [command.to_dict(bot.tree) for command in bot.tree.get_commands()]
+    data = json.dumps(payload, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(data.encode('utf-8')).hexdigest()
+
+
+async def sync_command_tree():
+    # 전역 명령어이므로 클러스터에서는 첫 번째 프로세스만 동기화
+    if CLUSTER_ID not in (None, 0):
+        return
+    
+    current = f"{bot.application_id}:{command_tree_hash()}"
+    
+    try:
+        with open(COMMAND_HASH_FILE, 'r', encoding='utf-8') as f:
+            stored = f.read().strip()
+    except OSError:
+        stored = None
     
-    load_configs()
+    if stored == current:
+        print('명령어가 바뀌지 않아 동기화를 건너뜁니다.')
+        return
     
     try:
         synced = await bot.tree.sync()
         print(f'{len(synced)}개의 명령어가 동기화되었습니다.')
     except Exception as e:
         print(f'명령어 동기화 중 오류 발생: {e}')
+        return
+    
+    with open(COMMAND_HASH_FILE, 'w', encoding='utf-8') as f:
+        f.write(current)
+
+
+def invalidate_guild_configs(guild_ids: list):
+    # 다른 프로세스가 저장한 서버 설정을 버리고 다음에 읽을 때 저장소에서 다시 불러옴
+    # 이 프로세스에서 저장 대기 중인 서버는 곧 덮어쓰므로 그대로 둠
+    dropped = 0
+    for guild_id in guild_ids:
+        guild_id_str = str(guild_id)
+        if guild_id_str in _dirty_guilds:
+            continue
+        if server_configs.pop(guild_id_str, None) is not None:
+            dropped += 1
+        _compiled_configs.pop(guild_id_str, None)
+    return dropped
+
+
+class ClusterBusHub:
+    
+    # 런처 프로세스에서 실행: 한 프로세스가 보낸 알림을 나머지 프로세스에 그대로 전달
+    def __init__(self, path: str):
+        self.path = path
+        self.relayed = 0
+        self._writers = set()
+        self._handlers = set()
+        self._server = None
+    
+    async def start(self):
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(self.path)
+        self._server = await asyncio.start_unix_server(self._handle, path=self.path)
+    
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self._writers.add(writer)
+        self._handlers.add(asyncio.current_task())
+        try:
+            async for line in reader:
+                for other in list(self._writers):
+                    if other is not writer and not other.is_closing():
+                        other.write(line)
+                self.relayed += 1
+        except ConnectionError:
+            pass
+        finally:
+            self._writers.discard(writer)
+            self._handlers.discard(asyncio.current_task())
+            writer.close()
+    
+    async def close(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+        for writer in list(self._writers):
+            writer.close()
+        # 연결을 닫으면 각 연결의 읽기 작업도 끝남
+        await asyncio.gather(*self._handlers, return_exceptions=True)
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(self.path)
+
+
+class ClusterBusClient:
+    
+    # 클러스터의 각 봇 프로세스에서 실행: 저장한 서버 ID를 보내고, 받은 서버 ID는 캐시에서 지움
+    def __init__(self, path: str, cluster_id: int, on_invalidate):
+        self.path = path
+        self.cluster_id = cluster_id
+        self.on_invalidate = on_invalidate
+        self.sent = 0
+        self.received = 0
+        self._writer = None
+        self._task = None
+    
+    async def connect(self):
+        reader, self._writer = await asyncio.open_unix_connection(self.path)
+        self._task = asyncio.ensure_future(self._read(reader))
+    
+    def publish(self, guild_ids):
+        if self._writer is None or self._writer.is_closing() or not guild_ids:
+            return
+        message = {"origin": self.cluster_id, "guilds": [str(guild_id) for guild_id in guild_ids]}
+        self._writer.write((json.dumps(message) + "\n").encode('utf-8'))
+        self.sent += 1
+    
+    async def _read(self, reader: asyncio.StreamReader):
+        async for line in reader:
+            try:
+                message = json.loads(line)
+            except ValueError:
+                continue
+            if message.get("origin") == self.cluster_id:
+                continue
+            self.received += 1
+            self.on_invalidate(message["guilds"])
+        print('클러스터 알림 연결이 끊어졌습니다. 설정은 CONFIG_RELOAD_INTERVAL마다 다시 확인합니다.')
+    
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+        if self._writer is not None:
+            self._writer.close()
+
+
+async def connect_cluster_bus():
+    global cluster_bus
+    client = ClusterBusClient(CLUSTER_BUS_PATH, CLUSTER_ID, invalidate_guild_configs)
+    try:
+        await client.connect()
+    except OSError as e:
+        # 알림 없이도 sqlite 변경 확인(CONFIG_RELOAD_INTERVAL)으로 결국 반영됨
+        print(f'클러스터 알림 소켓에 연결하지 못했습니다: {e}')
+        return
+    cluster_bus = client
+
+
+def cluster_shard_ranges(shard_count: int, cluster_count: int):
+    # 샤드를 연속된 구간으로 최대한 고르게 나눔
+    base, extra = divmod(shard_count, cluster_count)
+    ranges = []
+    start = 0
+    for cluster_id in range(cluster_count):
+        size = base + (1 if cluster_id < extra else 0)
+        ranges.append(list(range(start, start + size)))
+        start += size
+    return [shard_ids for shard_ids in ranges if shard_ids]
+
+
+async def _run_cluster_process(cluster_id: int, shard_ids: list, stopping: asyncio.Event):
+    env = dict(os.environ)
+    env["VERIFIED_CLUSTER_ID"] = str(cluster_id)
+    env["VERIFIED_SHARD_IDS"] = ",".join(str(shard_id) for shard_id in shard_ids)
+    env["VERIFIED_SHARD_COUNT"] = str(SHARD_COUNT)
+    
+    while not stopping.is_set():
+        print(f'[클러스터] 프로세스 {cluster_id} 시작 (샤드 {shard_ids[0]}~{shard_ids[-1]})')
+        # 빠른 시작/프로파일 옵션은 각 프로세스에도 그대로 전달
+        options = [arg for arg in sys.argv[1:] if arg in ("--fast-boot", "--profile-startup")]
+        process = await asyncio.create_subprocess_exec(sys.executable, os.path.abspath(__file__), *options, env=env)
+        try:
+            code = await process.wait()
+        except asyncio.CancelledError:
+            process.terminate()
+            await process.wait()
+            raise
+        if code == 0 or stopping.is_set():
+            return
+        # 비정상 종료면 잠시 후 다시 시작
+        print(f'[클러스터] 프로세스 {cluster_id}가 종료 코드 {code}로 끝났습니다. 5초 후 다시 시작합니다.')
+        await asyncio.sleep(5)
+
+
+async def _cluster_main():
+    hub = ClusterBusHub(CLUSTER_BUS_PATH)
+    await hub.start()
+    stopping = asyncio.Event()
+    
+    ranges = cluster_shard_ranges(SHARD_COUNT, CLUSTER_COUNT)
+    tasks = [
+        asyncio.ensure_future(_run_cluster_process(cluster_id, shard_ids, stopping))
+        for cluster_id, shard_ids in enumerate(ranges)
+    ]
+    try:
+        await asyncio.gather(*tasks)
+    finally:
+        stopping.set()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await hub.close()
+
+
+def run_cluster():
+    if sys.platform == "win32":
+        print("❌ 클러스터 모드는 유닉스 소켓을 쓰므로 윈도우에서는 사용할 수 없습니다.")
+        return
+    if STORAGE_BACKEND != "sqlite":
+        print('❌ 클러스터 모드에서는 STORAGE_BACKEND를 "sqlite"로 바꿔주세요. (json 파일은 여러 프로세스가 함께 쓸 수 없습니다)')
+        return
+    if not SHARD_COUNT:
+        print("❌ 클러스터 모드에서는 SHARD_COUNT를 지정해주세요.")
+        return
+    
+    # json에서 가져오기 같은 한 번만 할 작업을 프로세스를 띄우기 전에 끝냄
+    close_config_backend()
+    _get_backend()
+    close_config_backend()
+    
+    try:
+        asyncio.run(_cluster_main())
+    except KeyboardInterrupt:
+        pass
+
+
+@bot.event
+async def on_shard_ready(shard_id: int):
+    # 재연결로 다시 준비된 샤드는 건너뜀
+    if shard_id in shard_ready_stats:
+        return
+    await prepare_shard(shard_id)
+
+
+@bot.event
+async def on_ready():
+    if startup_report:
+        print(f'{bot.user} 게이트웨이에 다시 연결되었습니다.')
+        return
+    
+    record_startup_phase("게이트웨이 연결", bot.setup_finished_at)
+    print(f'{bot.user} 봇이 준비되었습니다!')
+    print(f'봇 ID: {bot.user.id}')
+    print('------')
+    
+    # 샤딩을 쓰지 않으면 on_shard_ready가 오지 않으므로 여기서 준비
+    if not isinstance(bot, commands.AutoShardedBot):
+        started = time.perf_counter()
+        await prepare_shard(0)
+        record_startup_phase("서버 설정 준비", started)
+    
+    record_startup_report()
+
+
+@bot.event
+async def on_guild_remove(guild: discord.Guild):
+    # 바로 지우지 않고 표시만 해 두었다가 CONFIG_TTL이 지나면 정리 작업에서 삭제
+    tombstone_guild_config(guild.id)
+
+
+@bot.event
+async def on_guild_join(guild: discord.Guild):
+    # 삭제되기 전에 다시 초대되면 기존 설정을 그대로 사용
+    restore_guild_config(guild.id)
+
+
+# 역할 순서/권한이 바뀌면 인증 역할 지급 가능 여부를 다시 확인
+@bot.event
+async def on_guild_role_update(before: discord.Role, after: discord.Role):
+    role_assignability.invalidate(after.guild.id)
+
+
+@bot.event
+async def on_guild_role_delete(role: discord.Role):
+    role_assignability.invalidate(role.guild.id)
+
+
+@bot.event
+async def on_member_update(before: discord.Member, after: discord.Member):
+    if after.id == bot.user.id:
+        role_assignability.invalidate(after.guild.id)
 
 
 @bot.tree.command(name="서버세팅", description="인증 봇 초기 세팅을 시작합니다")
@@ -533,9 +3242,9 @@ async def server_setup(interaction: discord.Interaction):
         )
         return
     
-    config = get_server_config(interaction.guild_id)
+    config = get_compiled_config(interaction.guild_id)
     
-    if config["setup_complete"]:
+    if config.setup_complete:
         await interaction.response.send_message(
             "✅ 이미 세팅이 완료되었습니다! `/세팅변경` 명령어로 설정을 변경하세요.",
             ephemeral=True
@@ -553,7 +3262,7 @@ async def server_setup(interaction: discord.Interaction):
         color=discord.Color.blue()
     )
     
-    view = SetupStartView(interaction.guild_id)
+    view = SetupStartView(interaction.guild_id, interaction.user.id)
     await interaction.response.send_message(embed=embed, view=view, ephemeral=True)
 
 
@@ -568,9 +3277,9 @@ async def change_settings(interaction: discord.Interaction):
         )
         return
     
-    config = get_server_config(interaction.guild_id)
+    config = get_compiled_config(interaction.guild_id)
     
-    if not config["setup_complete"]:
+    if not config.setup_complete:
         await interaction.response.send_message(
             "❌ 먼저 `/서버세팅` 명령어로 초기 세팅을 완료해주세요!",
             ephemeral=True
@@ -578,20 +3287,9 @@ async def change_settings(interaction: discord.Interaction):
         return
     
     # 1단계 View로 이동
-    view = SetupStep1View(interaction.guild_id)
-    
-    try:
-        embed_color = int(config["embed_color"], 16)
-    except:
-        embed_color = 0x00FF00
-    
-    embed = discord.Embed(
-        title=config["embed_title"],
-        description=config["embed_description"],
-        color=embed_color
-    )
+    view = SetupStep1View(interaction.guild_id, interaction.user.id)
     
-    await interaction.response.send_message(embed=embed, view=view, ephemeral=True)
+    await interaction.response.send_message(embed=config.embed, view=view, ephemeral=True)
 
 
 @bot.tree.command(name="인증", description="인증 시스템을 지정한 채널에 생성합니다")
@@ -609,40 +3307,28 @@ async def setup_verification(
         )
         return
     
-    config = get_server_config(interaction.guild_id)
+    config = get_compiled_config(interaction.guild_id)
     
-    if not config["setup_complete"]:
+    if not config.setup_complete:
         await interaction.response.send_message(
             "❌ 먼저 `/서버세팅` 명령어로 초기 세팅을 완료해주세요!",
             ephemeral=True
         )
         return
     
-    if not config.get("verified_role_id"):
+    if not config.verified_role_id:
         await interaction.response.send_message(
             "❌ 역할이 설정되지 않았습니다. `/세팅변경`으로 역할을 설정해주세요.",
             ephemeral=True
         )
         return
     
-    # 임베드 생성
-    try:
-        embed_color = int(config["embed_color"], 16)
-    except:
-        embed_color = 0x00FF00
-    
-    embed = discord.Embed(
-        title=config["embed_title"],
-        description=config["embed_description"],
-        color=embed_color
-    )
-    
     # View 생성
     view = VerificationView(interaction.guild_id)
     
     # 채널에 메시지 전송
     try:
-        await 채널.send(embed=embed, view=view)
+        await 채널.send(embed=config.embed, view=view)
         await interaction.response.send_message(
             f"✅ {채널.mention} 채널에 인증 시스템이 생성되었습니다!",
             ephemeral=True
@@ -659,11 +3345,224 @@ async def setup_verification(
         )
 
 
+@bot.tree.command(name="일괄인증", description="기존 멤버에게 인증 역할을 한꺼번에 지급합니다")
+@app_commands.describe(
+    가입전날짜="이 날짜(YYYY-MM-DD) 이전에 가입한 멤버만",
+    역할없는사람만="역할이 하나도 없는 멤버만",
+    처음부터="저장된 진행 상황을 무시하고 처음부터 다시 시작"
+)
+@app_commands.default_permissions(administrator=True)
+async def backfill_verification(
+    interaction: discord.Interaction,
+    가입전날짜: str = None,
+    역할없는사람만: bool = False,
+    처음부터: bool = False
+):
+    
+    if not interaction.user.guild_permissions.administrator:
+        await interaction.response.send_message(
+            "❌ 이 명령어는 관리자만 사용할 수 있습니다.",
+            ephemeral=True
+        )
+        return
+    
+    if not intents.members:
+        await interaction.response.send_message(
+            "❌ 린 모드에서는 멤버 목록을 불러올 수 없어 일괄 인증을 사용할 수 없습니다.",
+            ephemeral=True
+        )
+        return
+    
+    config = get_compiled_config(interaction.guild_id)
+    
+    if not config.verified_role_id or interaction.guild.get_role(config.verified_role_id) is None:
+        await interaction.response.send_message(
+            "❌ 역할이 설정되지 않았습니다. `/세팅변경`으로 역할을 설정해주세요.",
+            ephemeral=True
+        )
+        return
+    
+    if backfill_manager.is_running(interaction.guild_id):
+        await interaction.response.send_message(
+            "⏳ 이미 일괄 인증이 진행 중입니다.",
+            ephemeral=True
+        )
+        return
+    
+    joined_before = None
+    if 가입전날짜:
+        try:
+            joined_before = datetime.strptime(가입전날짜, "%Y-%m-%d").replace(tzinfo=timezone.utc)
+        except ValueError:
+            await interaction.response.send_message(
+                "❌ 날짜는 YYYY-MM-DD 형식으로 입력해주세요.",
+                ephemeral=True
+            )
+            return
+    
+    previous = backfill_manager.get(interaction.guild_id)
+    if 처음부터 or previous is None or previous["status"] == "done":
+        message = "⏳ 일괄 인증을 시작합니다..."
+    elif backfill_manager.can_resume(interaction.guild_id, config.verified_role_id, joined_before, 역할없는사람만):
+        message = "⏳ 이전 진행 상황부터 일괄 인증을 이어서 진행합니다..."
+    else:
+        message = "⏳ 이전 작업과 역할 또는 조건이 달라 일괄 인증을 처음부터 다시 시작합니다..."
+    
+    await interaction.response.send_message(message, ephemeral=True)
+    backfill_manager.start(
+        interaction.guild,
+        config.verified_role_id,
+        joined_before=joined_before,
+        no_roles_only=역할없는사람만,
+        restart=처음부터,
+        interaction=interaction
+    )
+
+
+@bot.event
+async def on_app_command_completion(interaction: discord.Interaction, command):
+    started = interaction.extras.get("started_at")
+    if started is not None:
+        metrics.observe("verified_command_seconds", time.perf_counter() - started, command=command.qualified_name)
+    record_first_interaction(started)
+
+
+def _collect_runtime_metrics():
+    samples = [
+        ("verified_responses_total", "counter", {"path": path}, count)
+        for path, count in response_path_stats.items()
+    ]
+    samples += [
+        ("verified_setup_views_live", "gauge", {}, len(setup_view_registry)),
+        ("verified_setup_views_evicted_total", "counter", {}, setup_view_registry.evicted),
+        ("verified_recently_verified_entries", "gauge", {}, len(recently_verified)),
+        ("verified_inflight_verifications", "gauge", {}, len(_inflight_verifications)),
+        ("verified_admission_active", "gauge", {}, admission.active),
+        ("verified_role_check_fast_failures_total", "counter", {}, role_assignability.fast_failures),
+        ("verified_admission_admitted_total", "counter", {}, admission.admitted),
+        ("verified_log_pending_embeds", "gauge", {}, verification_log_writer.pending()),
+        ("verified_config_dirty_guilds", "gauge", {}, len(_dirty_guilds)),
+        ("verified_config_reloads_total", "counter", {}, reload_stats["reloads"]),
+        ("verified_config_reloaded_guilds_total", "counter", {}, reload_stats["guilds_changed"]),
+        ("verified_config_gc_purged_total", "counter", {}, gc_stats["purged"]),
+        ("verified_config_entries", "gauge", {}, len(server_configs)),
+        ("verified_cluster_invalidations_sent_total", "counter", {}, cluster_bus.sent if cluster_bus else 0),
+        ("verified_cluster_invalidations_received_total", "counter", {}, cluster_bus.received if cluster_bus else 0)
+    ]
+    for guild_id in role_grant_scheduler.guild_ids():
+        stats = role_grant_scheduler.stats(guild_id)
+        samples.append(("verified_role_grant_queue_depth", "gauge", {"guild": guild_id}, stats["depth"]))
+        samples.append(("verified_role_grant_oldest_wait_seconds", "gauge", {"guild": guild_id}, stats["oldest_wait"]))
+    for shard in shard_status():
+        labels = {"shard": shard["shard_id"]}
+        samples.append(("verified_shard_latency_seconds", "gauge", labels, shard["latency_ms"] / 1000))
+        samples.append(("verified_shard_guilds", "gauge", labels, shard["guilds"]))
+    return samples
+
+
+metrics.add_collector(_collect_runtime_metrics)
+
+
+@bot.tree.command(name="인증통계", description="이 서버의 인증 통계를 확인합니다")
+@app_commands.default_permissions(administrator=True)
+async def verification_stats(interaction: discord.Interaction):
+    
+    if not interaction.user.guild_permissions.administrator:
+        await interaction.response.send_message(
+            "❌ 이 명령어는 관리자만 사용할 수 있습니다.",
+            ephemeral=True
+        )
+        return
+    
+    stats = verification_audit.stats(interaction.guild_id)
+    if stats is None:
+        await interaction.response.send_message(
+            "📊 아직 인증 기록이 없습니다.",
+            ephemeral=True
+        )
+        return
+    
+    embed = discord.Embed(title="📊 인증 통계", color=discord.Color.blue())
+    embed.add_field(name="전체 인증 완료", value=f"{stats['success']}회")
+    embed.add_field(name="전체 실패", value=f"{stats['failed']}회 ({stats['failure_rate'] * 100:.1f}%)")
+    embed.add_field(name="전체 클릭", value=f"{stats['total']}회")
+    embed.add_field(name="최근 24시간", value=f"{stats['success_24h']}회 (시간당 {stats['per_hour_24h']:.1f}회)")
+    embed.add_field(name="최근 24시간 실패율", value=f"{stats['failure_rate_24h'] * 100:.1f}%")
+    embed.add_field(name="이번 시간", value=f"{stats['this_hour']}회")
+    if stats["avg_latency_ms"] is not None:
+        embed.add_field(name="평균 처리 시간", value=f"{stats['avg_latency_ms']:.0f}ms")
+    
+    await interaction.response.send_message(embed=embed, ephemeral=True)
+
+
+@bot.tree.command(name="봇상태", description="봇 운영 상태를 확인합니다 (봇 소유자 전용)")
+@app_commands.default_permissions(administrator=True)
+async def bot_status(interaction: discord.Interaction):
+    
+    if not await bot.is_owner(interaction.user):
+        await interaction.response.send_message(
+            "❌ 이 명령어는 봇 소유자만 사용할 수 있습니다.",
+            ephemeral=True
+        )
+        return
+    
+    embed = discord.Embed(title="봇 상태", color=discord.Color.blue())
+    
+    shard_lines = [
+        f"샤드 {shard['shard_id']}: {shard['latency_ms']:.0f}ms, 서버 {shard['guilds']}개"
+        for shard in shard_status()
+    ]
+    embed.add_field(name="샤드", value="\n".join(shard_lines)[:1024] or "없음", inline=False)
+    
+    embed.add_field(
+        name="세팅 화면",
+        value=(
+            f"열려 있음 {len(setup_view_registry)}개 (최대 {SETUP_VIEW_MAX})\n"
+            f"밀려난 화면 {setup_view_registry.evicted}개, 시간 초과 {setup_view_registry.timed_out}개"
+        ),
+        inline=False
+    )
+    
+    last_gc = gc_stats["last_run"]
+    embed.add_field(
+        name="서버 설정",
+        value=(
+            f"메모리 {len(server_configs)}개, 저장 대기 {len(_dirty_guilds)}개\n"
+            f"정리된 설정 {gc_stats['purged']}개 "
+            f"(마지막 정리 {f'{last_gc:%m-%d %H:%M}' if last_gc else '없음'})"
+        ),
+        inline=False
+    )
+    
+    if startup_report:
+        memory = startup_report["max_rss_mb"]
+        embed.add_field(
+            name="시작",
+            value=(
+                f"준비까지 {startup_report['ready_seconds']:.1f}초\n"
+                f"최대 메모리 {f'{memory:.1f}MB' if memory is not None else '알 수 없음'}\n"
+                f"캐시된 멤버 {startup_report['cached_members']}명\n"
+                f"린 모드 {'켜짐' if startup_report['lean_mode'] else '꺼짐'}"
+            ),
+            inline=False
+        )
+    
+    await interaction.response.send_message(embed=embed, ephemeral=True)
+
+
 if __name__ == "__main__":
     TOKEN = "YOUT_BOT_TOKEN_HERE"
     
-    if TOKEN == "YOUR_BOT_TOKEN_HERE":
+    if "--compact-configs" in sys.argv:
+        compact_configs()
+        close_config_backend()
+    elif TOKEN == "YOUR_BOT_TOKEN_HERE":
         print("❌ 오류: 봇 토큰을 설정해주세요!")
         print("TOKEN 변수에 실제 봇 토큰을 입력하세요.")
+    elif "--cluster" in sys.argv:
+        run_cluster()
     else:
+        event_loop_name = install_event_loop()
+        RUN_STARTED = time.perf_counter()
         bot.run(TOKEN)
+        flush_configs_sync()